@@ -1,12 +1,29 @@
+# imported first, it notes the boot time used to measure cold start
+from chef.backend import BackendNotReady, SearchBackend
+
 # FastAPI is a framework for building server, like Flask.
-from fastapi import Body, FastAPI, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi import Body, FastAPI, Form, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
+from typing import Optional
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncio
 import pinecone
 import os
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Pinecone
+from chef.ingredient_index import IngredientIndex, hybrid_search
+from chef.local_index import DEFAULT_INDEX_PATH, load_index
+from chef.query_history import QueryHistory
+from chef.result_cache import (
+    ResultCache,
+    cache_key,
+    decode_cursor,
+    encode_cursor,
+    page_etag,
+)
 
 
 
@@ -15,7 +32,22 @@ from langchain.vectorstores import Pinecone
 # Tt's important to note that these tunnels have no uptime guarantee and are intended for temporary use. 
 # If you restart the tunnel, it's likely to generate a new URL each time.
 # cloudflared tunnel --url (your url address) 
+# CHEF_WARMUP=1 preloads the index and embeds the CHEF_WARMUP_QUERIES most
+# asked ingredients from earlier runs before traffic needs them.
+@asynccontextmanager
+async def lifespan(app):
+    backend.start()
+    if os.getenv("CHEF_WARMUP"):
+        top = int(os.getenv("CHEF_WARMUP_QUERIES", "100"))
+        asyncio.get_running_loop().create_task(
+            backend.warm_up(query_history.top(top))
+        )
+    yield
+    query_history.save()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="ChefGPT. The best provider of Korean Recipes in the world",
     description="Give CheftGPT a couple of ingredients and it will give recipes in return.",
     servers=[
@@ -27,29 +59,122 @@ app = FastAPI(
 # FastAPI doesn't load .env file.
 load_dotenv()
 
-pinecone.init(
-    api_key=os.getenv("PINECONE_API_KEY"),
-    environment="gcp-starter",
-)
+# CHEF_INDEX=local searches the index built by `python -m chef.local_index`
+# in-process, without calling Pinecone.
+def create_search_backend():
+    if os.getenv("CHEF_INDEX") == "local":
+        vector_store = load_index(os.getenv("CHEF_INDEX_PATH", DEFAULT_INDEX_PATH))
+    else:
+        pinecone.init(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            environment="gcp-starter",
+        )
 
-embeddings = OpenAIEmbeddings()
+        embeddings = OpenAIEmbeddings()
+
+        vector_store = Pinecone.from_existing_index(
+            "recipes",
+            embeddings,
+        )
+
+    ingredient_index = IngredientIndex.from_csv(
+        os.getenv("CHEF_RECIPES_CSV", "recipes.csv")
+    )
+    return vector_store, ingredient_index
 
-vector_store = Pinecone.from_existing_index(
-    "recipes",
-    embeddings,
-)
+
+# starts in the background with the server (chef/backend.py), /ready says when it's up
+backend = SearchBackend(create_search_backend)
+
+query_history = QueryHistory()
+
+
+# async so identical in-flight queries share one embedding and distinct ones
+# get batched into a single embed call (see chef/query_embedder.py).
+# Pinecone has no similarity_search_by_vector, only the with_score one.
+async def vector_search(query, k):
+    vector = await backend.query_embedder.embed(query)
+    results = await run_in_threadpool(
+        lambda: backend.vector_store.similarity_search_by_vector_with_score(vector, k=k)
+    )
+    return [doc for doc, _ in results]
 
 
 # Pydantic model
+# Fields left out with ?fields= are dropped from the response.
 class Document(BaseModel):
-    page_content: str
+    page_content: Optional[str] = None
+    title: Optional[str] = None
+    href: Optional[str] = None
+
+
+class RecipePage(BaseModel):
+    recipes: list[Document]
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as cursor to get the next page."
+    )
+
+
+# Searches are cached per normalized query and pages are sliced from them.
+# A page needing more results than were fetched searches again, deeper, up to
+# MAX_DEPTH: past that there is nothing more to fetch, so it isn't searched again.
+SEARCH_DEPTH = 20
+MAX_DEPTH = 200
+CACHE_MAX_AGE = 300
+DOCUMENT_FIELDS = ("page_content", "title", "href")
+
+result_cache = ResultCache(maxsize=1024, ttl=3600)
+
+
+def parse_fields(fields):
+    if not fields:
+        return DOCUMENT_FIELDS
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = set(selected) - set(DOCUMENT_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return selected
+
+
+def project(doc, selected):
+    values = {
+        "page_content": doc.page_content,
+        "title": doc.metadata.get("title"),
+        "href": doc.metadata.get("href"),
+    }
+    return {field: values[field] for field in selected}
+
+
+async def search_recipes(ingredient, needed):
+    key = cache_key(ingredient)
+    entry = result_cache.get(key)
+    if entry is None or (
+        not entry.exhausted and entry.depth < MAX_DEPTH and len(entry.documents) < needed
+    ):
+        depth = min(MAX_DEPTH, max(SEARCH_DEPTH, needed * 2))
+        docs, _ = await hybrid_search(
+            ingredient, backend.ingredient_index, vector_search, k=depth
+        )
+        entry = result_cache.put(key, docs, depth)
+    return entry
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
 
 @app.get(
     "/recipes",
     summary="Returns a list of recipes.",
-    description="Upon receiving an ingredient, this endpoint will return a list of recipes that contain that ingredient.",
-    response_description="A Document object that contains the recipe and preparation instructions",
-    response_model=list[Document],
+    description="Upon receiving an ingredient, this endpoint will return a list of recipes that contain that ingredient. Use limit and cursor to page through results and fields to only get title and href.",
+    response_description="A page of Document objects that contain the recipe and preparation instructions",
+    response_model=RecipePage,
+    response_model_exclude_none=True,
     openapi_extra={
         "x-openai-isConsequential": False,
     },
@@ -58,8 +183,53 @@ class Document(BaseModel):
 # hit command cloudflared tunnel --url http://127.0.0.1:8000
 # Paste that url.
 # https://spec-hc-heater-door.trycloudflare.com 
-def get_recipe(ingredient: str):
-    docs = vector_store.similarity_search(ingredient)
-    return docs
+# Plain ingredient queries are answered from the keyword index alone,
+# the embedding is only computed when that isn't enough (see chef/ingredient_index.py).
+async def get_recipe(
+    request: Request,
+    response: Response,
+    ingredient: str,
+    limit: int = Query(4, ge=1, le=50),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(
+        None, description="Comma separated subset of page_content, title, href."
+    ),
+):
+    try:
+        offset = decode_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = parse_fields(fields)
+
+    try:
+        await backend.wait_ready()
+    except BackendNotReady as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "5"}
+        )
+    query_history.record(ingredient)
+    entry = await search_recipes(ingredient, offset + limit)
+    docs = entry.documents[offset : offset + limit]
+    has_more = offset + limit < len(entry.documents) or (
+        not entry.exhausted and entry.depth < MAX_DEPTH
+    )
+    next_cursor = encode_cursor(offset + limit) if has_more and docs else None
+
+    etag = page_etag(docs, ",".join(selected), next_cursor)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    backend.mark_served()
+    return {
+        "recipes": [project(doc, selected) for doc in docs],
+        "next_cursor": next_cursor,
+    }
+
 
-    
+# Readiness probe, not part of the GPT action schema.
+@app.get("/ready", include_in_schema=False)
+def ready():
+    return JSONResponse(
+        backend.status(), status_code=200 if backend.ready else 503
+    )
@@ -0,0 +1,229 @@
+# Load test for the ChefGPT FastAPI app.
+#
+#   python -m benchmarks.chef_load --requests 2000 --concurrency 32
+#
+# Boots ChefGPT.app in-process with langchain's Pinecone store over
+# FakePineconeIndex (answering from a local recipe index) standing in for
+# Pinecone and SlowEmbeddings standing in for OpenAIEmbeddings, replays a
+# skewed mix of ingredient queries at the given concurrency and reports
+# req/s, latency percentiles and where each request's time went: embedding
+# (including the wait for the shared batched embed call), search, response
+# serialization, and "other" for routing, validation and waiting for the event
+# loop. Every request records its own stage times, so the shares stay right
+# at any concurrency. Pass --url to hit an already running server instead;
+# the time breakdown is only available in-process.
+
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import httpx
+from langchain.vectorstores import Pinecone
+
+from benchmarks.fakes import FakePineconeIndex, SlowEmbeddings
+from benchmarks.stats import format_ms, percentile
+from chef.embeddings import HashingEmbeddings
+from chef.local_index import DEFAULT_INDEX_PATH, build_index
+
+# most traffic is a handful of popular ingredients, with a long tail
+POPULAR = ["kimchi", "tofu", "rice", "garlic", "mushrooms", "noodles"]
+TAIL = [
+    "gochujang", "sesame oil", "spinach", "chickpeas", "coconut milk",
+    "peanut butter", "lentils", "sweet potato", "avocado", "ginger",
+    "soy sauce", "cabbage", "carrots", "seaweed", "bean sprouts", "zucchini",
+]  # fmt: skip
+COMBINED = ["tofu, rice", "kimchi or gochujang", "mushrooms and garlic"]
+
+
+def query_mix(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            ingredient = rng.choice(POPULAR)
+        elif roll < 0.9:
+            ingredient = rng.choice(TAIL)
+        else:
+            ingredient = rng.choice(COMBINED)
+        params = {"ingredient": ingredient}
+        if rng.random() < 0.3:
+            params["fields"] = "title,href"
+        if rng.random() < 0.1:
+            params["limit"] = 10
+        yield params
+
+
+STAGES = ("embedding", "search", "serialization")
+
+# stage times of the request being served, set per worker request
+current_stages = contextvars.ContextVar("current_stages", default=None)
+
+
+class StageTimer:
+    def __init__(self):
+        self.requests = []
+
+    @contextmanager
+    def request(self):
+        stages = defaultdict(float)
+        token = current_stages.set(stages)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages["total"] = time.perf_counter() - start
+            current_stages.reset(token)
+            self.requests.append(stages)
+
+    @contextmanager
+    def measure(self, stage):
+        stages = current_stages.get()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # time spent outside any request (the batched embed call's own
+            # task) isn't anyone's latency
+            if stages is not None:
+                stages[stage] += time.perf_counter() - start
+
+    def shares(self, stage):
+        """Each request's share of its own latency spent in stage."""
+        shares = []
+        for stages in self.requests:
+            if not stages["total"]:
+                continue
+            if stage == "other":
+                spent = max(0.0, stages["total"] - sum(stages[s] for s in STAGES))
+            else:
+                spent = stages[stage]
+            shares.append(spent / stages["total"])
+        return shares
+
+    def wrap(self, stage, func):
+        def wrapper(*args, **kwargs):
+            with self.measure(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def wrap_async(self, stage, func):
+        async def wrapper(*args, **kwargs):
+            with self.measure(stage):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+
+async def boot_app(args, timer):
+    index_path = args.index
+    if index_path is None:
+        index_path = os.path.join(tempfile.mkdtemp(), "recipe_index")
+        build_index(args.csv, index_path, HashingEmbeddings())
+    os.environ["CHEF_INDEX"] = "local"
+    os.environ["CHEF_INDEX_PATH"] = index_path
+
+    import fastapi.routing
+
+    import ChefGPT
+
+    backend = await ChefGPT.backend.wait_ready(timeout=None)
+    embeddings = SlowEmbeddings(args.embed_latency_ms / 1000)
+    # booted from the local index, then searched the way production searches
+    # Pinecone: only through the methods langchain's Pinecone store has
+    backend.vector_store = Pinecone(FakePineconeIndex(backend.vector_store), embeddings, "text")
+    backend.query_embedder.embeddings = embeddings
+    # keep the benchmark from skewing the real query history
+    ChefGPT.query_history.save = lambda: None
+    if args.cold:
+        backend.query_embedder.cache_size = 0
+        ChefGPT.result_cache.maxsize = 0
+
+    # the request's wait for its vector, batched with others or not
+    backend.query_embedder.embed = timer.wrap_async("embedding", backend.query_embedder.embed)
+    backend.vector_store._index.query = timer.wrap(
+        "search", backend.vector_store._index.query
+    )
+    backend.ingredient_index.search = timer.wrap(
+        "search", backend.ingredient_index.search
+    )
+    fastapi.routing.serialize_response = timer.wrap_async(
+        "serialization", fastapi.routing.serialize_response
+    )
+    return ChefGPT.app, embeddings
+
+
+async def run(args):
+    timer = StageTimer()
+    embeddings = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        app, embeddings = await boot_app(args, timer)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://chef"
+        )
+
+    queries = list(query_mix(args.requests, args.seed))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while queries:
+            params = queries.pop()
+            start = time.perf_counter()
+            with timer.request():
+                response = await client.get("/recipes", params=params)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    async with client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+
+    print(f"requests     {len(latencies)} ({errors} errors)")
+    print(f"concurrency  {args.concurrency}")
+    print(f"throughput   {len(latencies) / elapsed:8.1f} req/s")
+    for p in (50, 95, 99):
+        print(f"p{p:<11} {format_ms(percentile(latencies, p))}")
+
+    if embeddings is not None:
+        print(f"embed calls  {embeddings.calls}")
+        print("share of each request's latency   mean    p50    p95")
+        for stage in (*STAGES, "other"):
+            shares = timer.shares(stage)
+            mean = sum(shares) / len(shares) if shares else 0.0
+            print(
+                f"  {stage:<31} {mean:6.1%} {percentile(shares, 50):6.1%}"
+                f" {percentile(shares, 95):6.1%}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--csv", default="recipes.csv")
+    parser.add_argument(
+        "--index", help=f"existing index such as {DEFAULT_INDEX_PATH}"
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--embed-latency-ms", type=float, default=100.0)
+    parser.add_argument(
+        "--cold", action="store_true", help="disable the query and result caches"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Prompt size with the old format_docs vs utils/context_packer.py.
+#
+#   python -m benchmarks.context_packing --k 4 --max-tokens 1200
+#   python -m benchmarks.context_packing --ttft   # also time the first token from OpenAI
+#
+# Splits files/chapter_one.* like DocumentGPT does (300 token chunks, 100
+# overlap), retrieves the top k chunks for a set of questions with the offline
+# hashing embeddings and compares the context both ways. QuizGPT sends every
+# chunk of the file, that's the "whole file" line.
+
+import argparse
+import os
+import statistics
+import time
+
+from langchain.schema import Document
+from langchain.text_splitter import CharacterTextSplitter
+from langchain.vectorstores.faiss import FAISS
+
+from chef.embeddings import HashingEmbeddings
+from benchmarks.stats import format_ms
+from utils.context_packer import count_tokens, pack_context
+
+QUESTIONS = [
+    "What did old Major dream about?",
+    "Who is Mr. Jones?",
+    "Which animals came into the barn?",
+    "What is Beasts of England?",
+    "What did Major say about the life of an animal?",
+    "Who are Boxer and Clover?",
+    "Why are the rats comrades?",
+    "What happens when the animals sing?",
+    "Who is Benjamin?",
+    "What is Moses the raven doing?",
+]
+
+PROMPT = (
+    "Answer the question using ONLY the following context. If you don't "
+    "know the answer, just say you don't know. DON'T Make anything up.\n\n"
+    "Context: {context}\n\nQuestion: {question}"
+)
+
+
+def load_chapter(path):
+    if path.endswith(".txt"):
+        with open(path, encoding="utf-8-sig") as f:
+            return [Document(page_content=f.read(), metadata={"source": path})]
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    return UnstructuredFileLoader(path).load()
+
+
+def naive_format_docs(docs):
+    return "\n\n".join(document.page_content for document in docs)
+
+
+def first_token_seconds(llm, prompt):
+    start = time.perf_counter()
+    for _ in llm.stream(prompt):
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="./files/chapter_one.txt")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=1200)
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--ttft", action="store_true")
+    args = parser.parse_args()
+
+    # same splitter as the pages, counting with the packer's cached encoding
+    splitter = CharacterTextSplitter(
+        separator="\n",
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        length_function=count_tokens,
+    )
+    chunks = splitter.split_documents(load_chapter(args.file))
+    vectorstore = FAISS.from_documents(chunks, HashingEmbeddings())
+    print(f"{os.path.basename(args.file)}: {len(chunks)} chunks")
+
+    llm = None
+    if args.ttft:
+        from langchain.chat_models import ChatOpenAI
+
+        llm = ChatOpenAI(temperature=0.1, max_tokens=1)
+
+    rows = {"naive": [], "packed": []}
+    pack_times, ttfts = [], {"naive": [], "packed": []}
+    for question in QUESTIONS:
+        docs = vectorstore.similarity_search(question, k=args.k)
+        naive = naive_format_docs(docs)
+        start = time.perf_counter()
+        packed = pack_context(docs, max_tokens=args.max_tokens)
+        pack_times.append(time.perf_counter() - start)
+        for name, context in (("naive", naive), ("packed", packed)):
+            prompt = PROMPT.format(context=context, question=question)
+            rows[name].append(count_tokens(prompt))
+            if llm is not None:
+                ttfts[name].append(first_token_seconds(llm, prompt))
+
+    whole_naive = count_tokens(naive_format_docs(chunks))
+    whole_packed = count_tokens(pack_context(chunks))
+
+    naive_mean = statistics.mean(rows["naive"])
+    packed_mean = statistics.mean(rows["packed"])
+    print(f"top {args.k}, budget {args.max_tokens} tokens, {len(QUESTIONS)} questions")
+    print(f"  prompt tokens  naive {naive_mean:8.1f}  packed {packed_mean:8.1f}"
+          f"  ({1 - packed_mean / naive_mean:.1%} fewer)")
+    print(f"  packing time   {format_ms(statistics.mean(pack_times))} per question")
+    print(f"whole file (QuizGPT)  naive {whole_naive} tokens  packed {whole_packed} tokens"
+          f"  ({1 - whole_packed / whole_naive:.1%} fewer)")
+    if llm is not None:
+        for name in ("naive", "packed"):
+            print(f"  time to first token {name:>6}: {format_ms(statistics.median(ttfts[name]))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# LocalFileStore vs the packed SQLite store for the embedding cache.
+#
+#   python -m benchmarks.embedding_store --vectors 20000 --dim 1536
+#
+# Writes the same vectors to both stores in batches, then reads them back
+# (in batches like an upload would, and all at once like a warm-up) and
+# reports time, files created and disk space allocated.
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain.storage import LocalFileStore
+
+from benchmarks.stats import format_ms
+from utils.embedding_cache import chunk_key, encode_vector
+from utils.sqlite_store import SQLiteByteStore
+
+
+def allocated(path):
+    # blocks actually used, a 6 KB file still takes whole filesystem blocks
+    return os.stat(path).st_blocks * 512
+
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        ]
+    return len(paths), sum(allocated(p) for p in paths)
+
+
+def run(name, store, location, pairs, batch_size):
+    keys = [key for key, _ in pairs]
+
+    start = time.perf_counter()
+    for i in range(0, len(pairs), batch_size):
+        store.mset(pairs[i : i + batch_size])
+    put = time.perf_counter() - start
+
+    shuffled = keys[:]
+    random.Random(0).shuffle(shuffled)
+    start = time.perf_counter()
+    for i in range(0, len(shuffled), batch_size):
+        store.mget(shuffled[i : i + batch_size])
+    get = time.perf_counter() - start
+
+    start = time.perf_counter()
+    values = store.mget(keys)
+    warm = time.perf_counter() - start
+    assert all(value is not None for value in values)
+
+    if isinstance(store, SQLiteByteStore):
+        store.compact()
+    files, size = disk_usage(location)
+    print(
+        f"{name:>10}: put {format_ms(put)}  get {format_ms(get)}"
+        f"  get all {format_ms(warm)}  files {files:6d}  disk {size / 2**20:8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pairs = [
+        (chunk_key("bench", f"chunk {i}"), encode_vector(rng.random(args.dim)))
+        for i in range(args.vectors)
+    ]
+
+    root = tempfile.mkdtemp()
+    try:
+        files_path = os.path.join(root, "files")
+        run("files", LocalFileStore(files_path), files_path, pairs, args.batch_size)
+        sqlite_path = os.path.join(root, "embeddings.db")
+        store = SQLiteByteStore(sqlite_path)
+        run("sqlite", store, sqlite_path, pairs, args.batch_size)
+        store.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+# Local stand-ins for the remote services, so benchmarks run offline.
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+from pinecone.index import Index as PineconeIndex
+
+from chef.embeddings import HashingEmbeddings
+
+
+class SlowEmbeddings(HashingEmbeddings):
+    """Hashing embeddings that sleep like a remote embedding API would."""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class FakePineconeIndex(PineconeIndex):
+    """A pinecone.Index answering query() from a local recipe index.
+
+    Wrapped in langchain's own Pinecone store, so callers only get the
+    methods the real one has.
+    """
+
+    def __init__(self, local_index, text_key="text"):
+        # no super().__init__(): that would connect to the service
+        self.local_index = local_index
+        self.text_key = text_key
+        self.queries = 0
+
+    def query(self, vector=None, top_k=None, include_metadata=False, **kwargs):
+        self.queries += 1
+        # langchain passes a list with the one query vector
+        ids, scores = self.local_index.search_vector(vector[0], top_k)
+        matches = []
+        for i, score in zip(ids, scores):
+            doc = self.local_index.get_document(i)
+            metadata = {**doc.metadata, self.text_key: doc.page_content}
+            matches.append({"id": str(i), "score": float(score), "metadata": metadata})
+        return {"matches": matches}
+
+
+class FakeOllamaServer:
+    """A local /api/embeddings endpoint that answers like Ollama would.
+
+    capacity requests are worked on at once (like the model's parallel
+    slots), each taking latency seconds; failure_rate of them answer 503.
+    Embeddings are the hashing embeddings of the prompt, so callers can check
+    every vector came back for the right text.
+    """
+
+    def __init__(self, latency=0.05, capacity=4, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slots = threading.Semaphore(capacity)
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.embeddings = HashingEmbeddings()
+        self.requests = 0
+        self.failures = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.random_lock:
+                    fake.requests += 1
+                    fail = fake.random.random() < fake.failure_rate
+                    if fail:
+                        fake.failures += 1
+                if fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                with fake.slots:
+                    time.sleep(fake.latency)
+                    vector = fake.embeddings.embed_query(body["prompt"])
+                data = json.dumps({"embedding": vector}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeQuizModel(BaseChatModel):
+    """Answers the QuizGPT prompt with a streamed create_quiz function call.
+
+    Like the API: first_token seconds before anything arrives, then
+    tokens_per_second (a token taken as 4 characters). It writes as many
+    questions as the prompt asks for, made of words from its context so
+    different groups don't look like duplicates.
+    """
+
+    first_token: float = 0.5
+    tokens_per_second: float = 80.0
+    seed: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-quiz"
+
+    def _arguments(self, messages):
+        prompt = messages[-1].content
+        count = int(re.search(r"make (\d+) questions", prompt).group(1))
+        words = re.findall(r"[A-Za-z]{4,}", prompt.split("Context:", 1)[-1]) or ["text"]
+        rng = random.Random(f"{self.seed}{prompt}")
+        questions = [
+            {
+                "question": f"What does the text say about {' '.join(rng.sample(words, min(4, len(words))))}?",
+                "answers": [
+                    {"answer": rng.choice(words), "correct": i == 0} for i in range(4)
+                ],
+            }
+            for _ in range(count)
+        ]
+        return json.dumps({"questions": questions})
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        arguments = self._arguments(messages)
+        time.sleep(self.first_token)
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                additional_kwargs={"function_call": {"name": "create_quiz", "arguments": ""}},
+            )
+        )
+        for i in range(0, len(arguments), 4):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="",
+                    additional_kwargs={"function_call": {"arguments": arguments[i : i + 4]}},
+                )
+            )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        arguments = "".join(
+            chunk.message.additional_kwargs["function_call"]["arguments"]
+            for chunk in self._stream(messages, stop, run_manager, **kwargs)
+        )
+        message = AIMessage(
+            content="",
+            additional_kwargs={"function_call": {"name": "create_quiz", "arguments": arguments}},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeAnswerModel(BaseChatModel):
+    """A chat model that takes latency seconds to answer, sync or async.
+
+    Prompts containing "SLOW" take slow_latency instead and prompts
+    containing "FAIL" raise, like a stuck or failed API call.
+    """
+
+    latency: float = 1.0
+    slow_latency: float = 30.0
+
+    @property
+    def _llm_type(self):
+        return "fake-answer"
+
+    def _delay(self, messages):
+        prompt = messages[-1].content
+        if "FAIL" in prompt:
+            raise ValueError("The server had an error while processing your request")
+        return self.slow_latency if "SLOW" in prompt else self.latency
+
+    def _result(self):
+        message = AIMessage(content="The answer.\nScore: 4")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay(messages))
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay(messages))
+        return self._result()
+
+
+class FakeSiteServer:
+    """A local site with a sitemap, robots.txt and pages pages of HTML.
+
+    Connections are kept alive (HTTP/1.1). Each page takes latency seconds;
+    with capacity set, requests beyond capacity at once get a 429 like a
+    rate-limited host. Sitemaps over per_sitemap URLs are split behind a
+    sitemap index. crawl_delay goes into robots.txt.
+    """
+
+    def __init__(self, pages=500, latency=0.02, capacity=None, crawl_delay=None, per_sitemap=1000):
+        self.pages = pages
+        self.latency = latency
+        self.capacity = capacity
+        self.crawl_delay = crawl_delay
+        self.per_sitemap = per_sitemap
+        self.active = 0
+        self.active_lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        self.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def sitemap_url(self):
+        return f"{self.url}/sitemap.xml"
+
+    def _sitemap(self, path):
+        ns = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        parts = range(0, self.pages, self.per_sitemap)
+        if path == "/sitemap.xml" and len(parts) > 1:
+            items = "".join(
+                f"<sitemap><loc>{self.url}/sitemap-{i}.xml</loc></sitemap>"
+                for i in range(len(parts))
+            )
+            return f'<?xml version="1.0"?><sitemapindex {ns}>{items}</sitemapindex>'
+        part = 0 if path == "/sitemap.xml" else int(path[len("/sitemap-") : -len(".xml")])
+        first = part * self.per_sitemap
+        items = "".join(
+            f"<url><loc>{self.url}/page/{i}</loc><lastmod>2023-11-{i % 28 + 1:02d}</lastmod></url>"
+            for i in range(first, min(self.pages, first + self.per_sitemap))
+        )
+        return f'<?xml version="1.0"?><urlset {ns}>{items}</urlset>'
+
+    def _page(self, number):
+        body = "".join(f"<p>Paragraph {j} of page {number}. " + "Lorem ipsum " * 40 + "</p>" for j in range(8))
+        return (
+            f"<html><head><title>Page {number}</title></head><body><header>Menu</header>"
+            f"<main><h1>Page {number}</h1>{body}</main><footer>Footer</footer></body></html>"
+        )
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with fake.active_lock:
+                    fake.connections += 1
+
+            def send(self, status, body=b"", content_type="text/html"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with fake.active_lock:
+                    fake.requests += 1
+                    if fake.capacity and fake.active >= fake.capacity:
+                        fake.rejected += 1
+                        busy = True
+                    else:
+                        fake.active += 1
+                        busy = False
+                if busy:
+                    self.send(429)
+                    return
+                try:
+                    if self.path == "/robots.txt":
+                        lines = ["User-agent: *", "Disallow: /private/"]
+                        if fake.crawl_delay:
+                            lines.append(f"Crawl-delay: {fake.crawl_delay}")
+                        self.send(200, "\n".join(lines).encode(), "text/plain")
+                    elif self.path.startswith("/sitemap"):
+                        self.send(200, fake._sitemap(self.path).encode(), "application/xml")
+                    elif self.path.startswith("/page/"):
+                        time.sleep(fake.latency)
+                        self.send(200, fake._page(int(self.path[len("/page/") :])).encode())
+                    else:
+                        self.send(404)
+                finally:
+                    with fake.active_lock:
+                        fake.active -= 1
+
+        return Handler
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
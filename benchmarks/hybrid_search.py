@@ -0,0 +1,115 @@
+# Compare the pure vector path of /recipes with the hybrid keyword + vector path.
+#
+#   python -m benchmarks.hybrid_search --embed-latency-ms 150
+#
+# Uses the offline hashing embeddings, with an artificial delay standing in
+# for the OpenAI round-trip. "Relevant" recipes for a query are the ones whose
+# raw ingredient list contains every queried ingredient, and recall@k is
+# measured against that.
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from chef.embeddings import HashingEmbeddings
+from chef.ingredient_index import IngredientIndex, hybrid_search
+from chef.local_index import build_index, load_index, read_recipes
+from benchmarks.fakes import SlowEmbeddings
+from benchmarks.stats import format_ms, percentile
+
+QUERIES = [
+    "kimchi",
+    "tofu",
+    "rice",
+    "tofu, rice",
+    "chickpeas",
+    "coconut milk",
+    "mushrooms and garlic",
+    "gochujang or kimchi",
+    "sesame oil",
+    "spinach",
+    "peanut butter",
+    "lentils, tomatoes",
+    "soy sauce, ginger",
+    "avocado",
+    "sweet potato",
+    "noodles or rice",
+]
+
+
+def relevant_hrefs(rows, query):
+    groups = [
+        [part.strip().lower() for part in group.replace(" and ", ",").split(",")]
+        for group in query.split(" or ")
+    ]
+    relevant = set()
+    for row in rows:
+        ingredients = row["ingredients"].lower()
+        if any(all(part in ingredients for part in group) for group in groups):
+            relevant.add(row["href"].strip())
+    return relevant
+
+
+def recall(docs, relevant, k):
+    if not relevant:
+        return 1.0
+    found = sum(1 for doc in docs if doc.metadata["href"] in relevant)
+    return found / min(k, len(relevant))
+
+
+def report(name, latencies, recalls, calls):
+    print(
+        f"{name:>8}: p50 {format_ms(percentile(latencies, 50))}"
+        f"  p95 {format_ms(percentile(latencies, 95))}"
+        f"  recall@k {statistics.mean(recalls):.3f}"
+        f"  embedding calls {calls}"
+    )
+
+
+async def run(args):
+    index_path = args.index
+    if index_path is None:
+        index_path = os.path.join(tempfile.mkdtemp(), "recipe_index")
+        build_index(args.csv, index_path, HashingEmbeddings())
+
+    embeddings = SlowEmbeddings(args.embed_latency_ms / 1000)
+    vector_store = load_index(index_path, embeddings)
+    ingredient_index = IngredientIndex.from_csv(args.csv)
+    rows = list(read_recipes(args.csv))
+    relevant = {query: relevant_hrefs(rows, query) for query in QUERIES}
+
+    async def vector_search(query, k):
+        return vector_store.similarity_search(query, k)
+
+    for name in ("vector", "hybrid"):
+        embeddings.calls = 0
+        latencies, recalls = [], []
+        for _ in range(args.rounds):
+            for query in QUERIES:
+                start = time.perf_counter()
+                if name == "vector":
+                    docs = await vector_search(query, args.k)
+                else:
+                    docs, _ = await hybrid_search(
+                        query, ingredient_index, vector_search, args.k
+                    )
+                latencies.append(time.perf_counter() - start)
+                recalls.append(recall(docs, relevant[query], args.k))
+        report(name, latencies, recalls, embeddings.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="recipes.csv")
+    parser.add_argument("--index", help="existing index, built from --csv if omitted")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=100.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Flat vs IVF vs HNSW at growing corpus sizes, to pick the "auto" thresholds
+# in utils/quantized_index.py.
+#
+#   python -m benchmarks.index_types --sizes 1000,100000,1000000 --dim 128
+#
+# Same embedding-like synthetic vectors as benchmarks/quantized_index.py,
+# queries are perturbed copies of random vectors in the corpus.
+# For each size every index is built from scratch; queries are timed one at
+# a time (like a chat question) and recall@k is against the flat search.
+# IVF and HNSW are run at a few nprobe / efSearch settings.
+
+import argparse
+import time
+from fractions import Fraction
+
+import faiss
+import numpy as np
+
+from benchmarks.quantized_index import embedding_like, recall
+from benchmarks.stats import format_ms, percentile
+from utils.quantized_index import build_index, choose_index_type, set_search_params
+
+
+def time_queries(index, queries, k):
+    found, times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        times.append(time.perf_counter() - start)
+        found.append(list(ids[0]))
+    return found, times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="flat,ivf,hnsw")
+    parser.add_argument("--nprobe", default="1/32,1/16,1/4", help="fractions of nlist")
+    parser.add_argument("--ef-search", default="16,64,256")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)  # one query at a time, like the app
+    rng = np.random.default_rng(0)
+    basis = rng.normal(size=(32, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    for size in [int(s) for s in args.sizes.split(",")]:
+        vectors = embedding_like(rng, basis, size, max(10, size // 500))
+        # questions land near some of the content, not exactly on it
+        queries = vectors[rng.integers(0, size, args.queries)]
+        queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        print(f"{size} vectors x {args.dim} dims, top {args.k}, auto picks {choose_index_type(size)}")
+
+        truth = None
+        for index_type in ["flat"] + [t for t in args.types.split(",") if t != "flat"]:
+            start = time.perf_counter()
+            index = build_index(vectors, index_type)
+            build = time.perf_counter() - start
+            if isinstance(index, faiss.IndexIVF):
+                settings = [
+                    ("nprobe", max(1, int(index.nlist * Fraction(fraction))))
+                    for fraction in args.nprobe.split(",")
+                ]
+            elif isinstance(index, faiss.IndexHNSW):
+                settings = [("efSearch", int(ef)) for ef in args.ef_search.split(",")]
+            else:
+                settings = [(None, None)]
+            for name, value in settings:
+                if name == "nprobe":
+                    set_search_params(index, nprobe=value)
+                elif name == "efSearch":
+                    set_search_params(index, ef_search=value)
+                found, times = time_queries(index, queries, args.k)
+                if truth is None:
+                    truth = found
+                label = index_type if name is None else f"{index_type} {name}={value}"
+                print(
+                    f"  {label:>20}: build {build:7.2f} s"
+                    f"  query p50 {format_ms(percentile(times, 50))}"
+                    f"  p99 {format_ms(percentile(times, 99))}"
+                    f"  recall@{args.k} {recall(found, truth, args.k):.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
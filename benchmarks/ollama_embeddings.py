@@ -0,0 +1,96 @@
+# Indexing throughput of OllamaEmbeddings alone vs ParallelEmbeddings.
+#
+#   python -m benchmarks.ollama_embeddings --latency-ms 50 --capacity 4
+#   python -m benchmarks.ollama_embeddings --failure-rate 0.05   # exercise retries
+#
+# Runs against benchmarks.fakes.FakeOllamaServer on localhost, which works
+# on --capacity requests at a time, so throughput should grow with the
+# worker count until it reaches the capacity and then stay flat. Every run
+# checks that each vector came back for the right chunk before building the
+# FAISS index from it.
+
+import argparse
+import time
+
+from langchain.embeddings import OllamaEmbeddings
+from langchain.schema import Document
+from langchain.text_splitter import CharacterTextSplitter
+from langchain.vectorstores.faiss import FAISS
+
+from chef.embeddings import HashingEmbeddings
+from benchmarks.fakes import FakeOllamaServer
+from utils.context_packer import count_tokens
+from utils.parallel_embeddings import ParallelEmbeddings
+
+
+def load_chunks(path, chunk_size):
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    splitter = CharacterTextSplitter(
+        separator="\n",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_size // 6,
+        length_function=count_tokens,
+    )
+    return splitter.split_documents([Document(page_content=text, metadata={"source": path})])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="./files/chapter_one.txt")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    docs = load_chunks(args.file, args.chunk_size)
+    hashing = HashingEmbeddings()
+
+    with FakeOllamaServer(
+        latency=args.latency_ms / 1000,
+        capacity=args.capacity,
+        failure_rate=args.failure_rate,
+    ) as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        expected = hashing.embed_documents(
+            [f"{ollama.embed_instruction}{doc.page_content}" for doc in docs]
+        )
+        print(
+            f"{len(docs)} chunks, server: {args.latency_ms:.0f} ms per request,"
+            f" {args.capacity} at a time, {args.failure_rate:.0%} failures"
+        )
+
+        runs = [("sequential", ollama)]
+        for workers in [int(w) for w in args.workers.split(",")]:
+            runs.append(
+                (
+                    f"{workers} workers",
+                    ParallelEmbeddings(
+                        ollama, workers=workers, batch_size=args.batch_size, backoff=0.05
+                    ),
+                )
+            )
+        for name, embeddings in runs:
+            if args.failure_rate and embeddings is ollama:
+                continue  # fails on the first 503
+            start = time.perf_counter()
+            vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+            seconds = time.perf_counter() - start
+            assert vectors == expected, f"{name}: vectors out of order"
+            FAISS.from_embeddings(
+                [(doc.page_content, vector) for doc, vector in zip(docs, vectors)],
+                embeddings,
+                metadatas=[doc.metadata for doc in docs],
+            )
+            retries = getattr(embeddings, "stats", {}).get("retries", 0)
+            print(
+                f"{name:>12}: {seconds:6.2f} s  {len(docs) / seconds:7.1f} chunks/s"
+                f"  retries {retries}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Flat vs scalar-quantized vs product-quantized FAISS for llama2-sized vectors.
+#
+#   python -m benchmarks.quantized_index --vectors 20000 --dim 4096
+#
+# The vectors are clustered in a low dimensional subspace, like real
+# embeddings, so neighbours mean something; recall@k is measured against the exact flat
+# search. Memory is the size of the index itself; re-ranking also reads
+# k x rerank rows per query from the memory-mapped vectors.npy.
+
+import argparse
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.stats import format_ms, percentile
+from utils.quantized_index import PQ_MIN_VECTORS, build_index
+
+
+def embedding_like(rng, basis, count, clusters):
+    # real embeddings live close to a low dimensional subspace: clustered
+    # points in a small latent space, projected up to the full dimension
+    latent_dim = basis.shape[0]
+    centres = rng.normal(size=(clusters, latent_dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    latent = centres[labels] + rng.normal(scale=0.5, size=(count, latent_dim)).astype(np.float32)
+    noise = rng.normal(scale=0.01, size=(count, basis.shape[1])).astype(np.float32)
+    return latent @ basis + noise
+
+
+def recall(found, truth, k):
+    return statistics.mean(len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth))
+
+
+def search(index, queries, k, rerank, vectors):
+    results, times = [], []
+    for query in queries:
+        query = query[None, :]
+        start = time.perf_counter()
+        if rerank:
+            _, ids = index.search(query, k * rerank)
+            ids = ids[0][ids[0] != -1]
+            distances = ((vectors[ids] - query) ** 2).sum(axis=1)
+            found = ids[np.argsort(distances)[:k]]
+        else:
+            _, ids = index.search(query, k)
+            found = ids[0]
+        times.append(time.perf_counter() - start)
+        results.append(list(found))
+    return results, times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=4096)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--latent-dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank", type=int, default=None, help="default: 4 for sq8, 10 for pq")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    basis = rng.normal(size=(args.latent_dim, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    vectors = embedding_like(rng, basis, args.vectors, args.clusters)
+    queries = embedding_like(rng, basis, args.queries, args.clusters)
+    print(f"{args.vectors} vectors x {args.dim} dims, top {args.k}")
+
+    truth = None
+    for index_type in ("flat", "sq8", "pq"):
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build = time.perf_counter() - start
+        size = len(faiss.serialize_index(index))
+        if index_type == "pq" and not isinstance(index, faiss.IndexPQ):
+            print(f"  pq needs {PQ_MIN_VECTORS} vectors to train, these rows are {type(index).__name__}")
+        runs = [(index_type, 0)]
+        if index_type != "flat":
+            rerank = args.rerank or (10 if index_type == "pq" else 4)
+            runs.append((f"{index_type}+rerank", rerank))
+        for name, rerank in runs:
+            found, times = search(index, queries, args.k, rerank, vectors)
+            if truth is None:
+                truth = found
+            reads = args.k * rerank * args.dim * 4
+            print(
+                f"{name:>12}: {type(index).__name__:<21} index {size / 2**20:8.1f} MB  build {build:6.2f} s"
+                f"  query p50 {format_ms(percentile(times, 50))}"
+                f"  p95 {format_ms(percentile(times, 95))}"
+                f"  recall@{args.k} {recall(found, truth, args.k):.3f}"
+                + (f"  reads {reads / 1024:.0f} KB/query" if reads else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Time to the first QuizGPT question: one blocking call vs streamed ones.
+#
+#   python -m benchmarks.quiz_streaming --count 10 --tokens-per-second 80
+#
+# Runs the page's questions chain (utils/quiz.py) against
+# benchmarks.fakes.FakeQuizModel, which streams the create_quiz arguments at
+# an API-like rate. Four ways to make the same quiz:
+#
+#   blocking         the whole file in one call, json.loads at the end (how
+#                    the page worked before)
+#   streamed         the same call, each question parsed as it closes
+#   groups           chunk groups in parallel, json.loads per group
+#   groups+streamed  chunk groups in parallel, each question as it closes
+#                    (what the page does now)
+
+import argparse
+import json
+import time
+
+from langchain.document_loaders import TextLoader
+from langchain.text_splitter import CharacterTextSplitter
+
+from benchmarks.fakes import FakeQuizModel
+from utils.context_packer import count_tokens
+from utils.quiz import (
+    QUIZ_GROUP_TOKENS,
+    QUIZ_WORKERS,
+    SPLITTER,
+    build_questions_chain,
+    build_questions_prompt,
+    generate_quiz,
+    group_chunks,
+    make_quiz,
+    stream_questions,
+)
+
+
+def load_chunks(path):
+    # counted with count_tokens so it also runs without tiktoken's download
+    splitter = CharacterTextSplitter(length_function=count_tokens, **SPLITTER)
+    return TextLoader(path, encoding="utf-8-sig").load_and_split(text_splitter=splitter)
+
+
+def blocking_questions(chain, docs, count):
+    response = chain.invoke({"docs": docs, "count": count})
+    response = response.additional_kwargs["function_call"]["arguments"]
+    return json.loads(response)["questions"]
+
+
+def timed(run):
+    start = time.perf_counter()
+    first, total = None, 0
+    for _ in run():
+        total += 1
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="./files/chapter_one.txt")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    args = parser.parse_args()
+
+    docs = load_chunks(args.file)
+    model = FakeQuizModel(
+        first_token=args.first_token_ms / 1000, tokens_per_second=args.tokens_per_second
+    )
+    chain = build_questions_chain(model, build_questions_prompt())
+    groups = group_chunks(docs, QUIZ_GROUP_TOKENS)
+    print(
+        f"{len(docs)} chunks in {len(groups)} groups, {args.count} questions,"
+        f" model: {args.first_token_ms:.0f} ms to first token, {args.tokens_per_second:.0f} tokens/s"
+    )
+
+    runs = [
+        ("blocking", lambda: blocking_questions(chain, docs, args.count)),
+        ("streamed", lambda: stream_questions(chain, docs, args.count)),
+        (
+            "groups",
+            lambda: generate_quiz(
+                groups,
+                lambda group, count: blocking_questions(chain, group, count),
+                args.count,
+                workers=QUIZ_WORKERS,
+            ),
+        ),
+        ("groups+streamed", lambda: make_quiz(chain, docs, args.count)),
+    ]
+    for name, run in runs:
+        first, total, questions = timed(run)
+        print(
+            f"{name:>16}: first question {first:6.2f} s  all {total:6.2f} s"
+            f"  ({questions} questions)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# What a Streamlit rerun spends building models, prompts and chains.
+#
+#   OPENAI_API_KEY=... python -m benchmarks.rerun_overhead --reruns 200
+#
+# setup() does what the top of DocumentGPT, QuizGPT and SiteGPT do on every
+# rerun (plus building a chain per question, as DocumentGPT and PrivateGPT
+# used to). It's timed once with the process registry (utils/registry.py) and
+# once with the same factories called directly, which is how the pages worked
+# before. No requests are sent; the key only has to be set.
+
+import argparse
+import os
+import statistics
+import time
+
+from langchain.chat_models import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from benchmarks.stats import format_ms, percentile
+from utils import registry
+
+
+def build_qa_chain(llm, prompt):
+    return (
+        RunnablePassthrough.assign(
+            context=RunnableLambda(lambda inputs: inputs["retriever"])
+        )
+        | prompt
+        | llm
+    )
+
+
+def setup(get_model, get_resource, get_chain):
+    llm = get_model(ChatOpenAI, temperature=0.1, streaming=True)
+    get_model(ChatOpenAI, temperature=0.1)
+    get_model(ChatOpenAI, temperature=0.1, model="gpt-3.5-turbo-1106", streaming=True)
+    prompt = get_resource(
+        "qa_prompt",
+        ChatPromptTemplate.from_messages,
+        messages=[("system", "Answer using ONLY this context: {context}"), ("human", "{question}")],
+    )
+    get_resource(
+        "answers_prompt",
+        ChatPromptTemplate.from_template,
+        template="Context: {context}\n\nQuestion: {question}\nAnswer and score:",
+    )
+    get_resource(
+        "splitter",
+        RecursiveCharacterTextSplitter,
+        chunk_size=800,
+        chunk_overlap=100,
+    )
+    return get_chain("qa", build_qa_chain, llm=llm, prompt=prompt)
+
+
+def direct_get_model(model_class, **config):
+    return model_class(**config)
+
+
+def direct_get_resource(kind, factory, **config):
+    return factory(**config)
+
+
+def time_reruns(reruns, *getters):
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        setup(*getters)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reruns", type=int, default=200)
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    results = {
+        "per rerun": time_reruns(
+            args.reruns, direct_get_model, direct_get_resource, direct_get_resource
+        ),
+        "registry": time_reruns(
+            args.reruns, registry.get_model, registry.get_resource, registry.get_chain
+        ),
+    }
+    for name, times in results.items():
+        print(
+            f"{name:>10}: mean {format_ms(statistics.mean(times))}"
+            f"  p50 {format_ms(percentile(times, 50))}"
+            f"  p99 {format_ms(percentile(times, 99))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Adding, removing and searching files in a ShardedCorpus.
+#
+#   python -m benchmarks.sharded_corpus --files 1000 --chunks 200 --dim 1536
+#
+# Every "file" is a FAISS shard of random vectors. Adding a file to one
+# merged index means rebuilding (and re-embedding, without a cache) all of
+# it; the corpus just registers the new shard. Queries are timed with the
+# parallel fan-out and with the shards searched one after another.
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.faiss import FAISS
+
+from benchmarks.stats import format_ms, percentile
+from utils.corpus import ShardedCorpus
+
+
+class RandomQueryEmbeddings(Embeddings):
+    def __init__(self, dim, seed=1):
+        self.rng = np.random.default_rng(seed)
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.rng.random(self.dim, dtype=np.float32).tolist()
+
+
+def make_shard(rng, embeddings, chunks, dim, name):
+    vectors = rng.random((chunks, dim), dtype=np.float32)
+    return FAISS.from_embeddings(
+        [(f"{name} chunk {i}", vector) for i, vector in enumerate(vectors.tolist())],
+        embeddings,
+        metadatas=[{"source": name}] * chunks,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = RandomQueryEmbeddings(args.dim)
+    shards = [make_shard(rng, embeddings, args.chunks, args.dim, f"file{i}") for i in range(args.files)]
+
+    corpus = ShardedCorpus(embeddings, max_workers=args.workers)
+    adds = []
+    for i, shard in enumerate(shards):
+        start = time.perf_counter()
+        corpus.add(f"file{i}", shard)
+        adds.append(time.perf_counter() - start)
+
+    def time_queries(parallel):
+        times = []
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            if parallel:
+                corpus.search_with_score("question", k=4)
+            else:
+                vector = embeddings.embed_query("question")
+                hits = [
+                    hit
+                    for shard in shards
+                    for hit in shard.similarity_search_with_score_by_vector(vector, 4)
+                ]
+                sorted(hits, key=lambda hit: hit[1])[:4]
+            times.append(time.perf_counter() - start)
+        return times
+
+    serial = time_queries(False)
+    parallel = time_queries(True)
+
+    start = time.perf_counter()
+    corpus.remove("file0")
+    removed = time.perf_counter() - start
+
+    total = args.files * args.chunks
+    print(f"{args.files} files x {args.chunks} chunks = {total} vectors, dim {args.dim}")
+    print(f"  add file     {format_ms(statistics.mean(adds))}  (after the file itself is embedded)")
+    print(f"  remove file  {format_ms(removed)}")
+    for name, times in (("serial", serial), (f"{args.workers} workers", parallel)):
+        print(
+            f"  query {name:>10}: p50 {format_ms(percentile(times, 50))}"
+            f"  p95 {format_ms(percentile(times, 95))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
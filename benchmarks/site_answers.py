@@ -0,0 +1,74 @@
+# SiteGPT's answer-per-page step: one call after the other vs all at once.
+#
+#   python -m benchmarks.site_answers --docs 6 --latency-ms 1000 --timeout 3
+#
+# Runs against benchmarks.fakes.FakeAnswerModel, which takes --latency-ms a
+# call. The "degraded" runs add one page whose call hangs (--slow-ms) and
+# one whose call fails: sequentially the hang is waited out and the failure
+# loses the whole question, concurrently both are left out after at most
+# --timeout seconds. The choosing call is the same either way and not run.
+
+import argparse
+import time
+
+from langchain.prompts import ChatPromptTemplate
+
+from benchmarks.fakes import FakeAnswerModel
+from utils.fanout import batch_with_timeout
+
+
+def sequential(chain, inputs):
+    # how get_answers used to do it
+    return [chain.invoke(input).content for input in inputs]
+
+
+def concurrent(chain, inputs, max_concurrency, timeout):
+    results = batch_with_timeout(
+        chain, inputs, max_concurrency=max_concurrency, timeout=timeout
+    )
+    return [r.content for r in results if not isinstance(r, BaseException)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=6)
+    parser.add_argument("--latency-ms", type=float, default=1000)
+    parser.add_argument("--slow-ms", type=float, default=30000)
+    parser.add_argument("--timeout", type=float, default=3)
+    parser.add_argument("--concurrency", default="1,4,8")
+    args = parser.parse_args()
+
+    model = FakeAnswerModel(latency=args.latency_ms / 1000, slow_latency=args.slow_ms / 1000)
+    chain = ChatPromptTemplate.from_template("Context: {context}\nQuestion: {question}") | model
+    pages = [f"page {i}" for i in range(args.docs)]
+    cases = [
+        ("healthy", pages),
+        ("degraded", pages[:-2] + ["SLOW page", "FAIL page"]),
+    ]
+    print(f"{args.docs} pages, {args.latency_ms:.0f} ms a call, timeout {args.timeout:.0f} s")
+
+    for case, contexts in cases:
+        inputs = [{"question": "What is it?", "context": c} for c in contexts]
+        runs = [("sequential", lambda: sequential(chain, inputs))]
+        for limit in [int(c) for c in args.concurrency.split(",")]:
+            runs.append(
+                (
+                    f"concurrent x{limit}",
+                    lambda limit=limit: concurrent(chain, inputs, limit, args.timeout),
+                )
+            )
+        for name, run in runs:
+            if case == "degraded" and name == "sequential":
+                # would wait out the hang, then raise on the failed page
+                print(f"  {case:>8} {name:>14}: not run, hangs {args.slow_ms / 1000:.0f} s then fails")
+                continue
+            start = time.perf_counter()
+            answers = run()
+            seconds = time.perf_counter() - start
+            print(
+                f"  {case:>8} {name:>14}: {seconds:6.2f} s  {len(answers)}/{len(inputs)} answers"
+            )
+
+
+if __name__ == "__main__":
+    main()
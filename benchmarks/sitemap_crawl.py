@@ -0,0 +1,116 @@
+# SitemapLoader vs utils/crawler.py against a local site.
+#
+#   python -m benchmarks.sitemap_crawl --pages 2000 --latency-ms 50
+#   python -m benchmarks.sitemap_crawl --capacity 4 --skip-loader    # 429 above 4 at once
+#   python -m benchmarks.sitemap_crawl --crawl-delay 1 --pages 20 --skip-loader
+#
+# benchmarks.fakes.FakeSiteServer serves a sitemap (split behind a sitemap
+# index past 1000 URLs), robots.txt and HTML pages that take --latency-ms
+# each. Both loaders parse the pages with SiteGPT's parse_page. SitemapLoader
+# runs the way load_website used it (requests_per_second = 2) and needs lxml;
+# it's skipped without it. "first page" is how long the first parsed
+# document took to come out, "connections" how many TCP connections the
+# server accepted.
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakes import FakeSiteServer
+from utils.crawler import SitemapCrawler
+
+
+def parse_page(soup):
+    # pages/04_SiteGPT.py
+    header = soup.find("header")
+    footer = soup.find("footer")
+    if header:
+        header.decompose()
+    if footer:
+        footer.decompose()
+    return (
+        str(soup.get_text())
+        .replace("\n", " ")
+        .replace("\xa0", " ")
+        .replace("CloseSearch Submit Blog", "")
+    )
+
+
+def run_sitemap_loader(server):
+    from langchain.document_loaders import SitemapLoader
+
+    loader = SitemapLoader(server.sitemap_url, parsing_function=parse_page)
+    loader.requests_per_second = 2
+    start = time.perf_counter()
+    docs = loader.load()
+    seconds = time.perf_counter() - start
+    # everything arrives at the end
+    return len(docs), seconds, seconds, ""
+
+
+def run_crawler(server, **kwargs):
+    crawler = SitemapCrawler(server.sitemap_url, parsing_function=parse_page, **kwargs)
+
+    async def crawl():
+        start = time.perf_counter()
+        first, count = None, 0
+        async for _ in crawler.crawl():
+            count += 1
+            if first is None:
+                first = time.perf_counter() - start
+        return count, first, time.perf_counter() - start
+
+    count, first, seconds = asyncio.run(crawl())
+    rates = ", ".join(f"{bucket.rate:.1f}" for bucket in crawler.buckets.values())
+    stats = crawler.stats
+    return count, first, seconds, (
+        f"  retries {stats['retries']} (throttled {stats['throttled']})"
+        f"  final rate {rates}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--capacity", type=int, default=None)
+    parser.add_argument("--crawl-delay", type=int, default=None, help="seconds, whole ones like robotparser reads")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rates", default="8:64,8:256", help="start:max per host")
+    parser.add_argument("--skip-loader", action="store_true")
+    args = parser.parse_args()
+
+    print(
+        f"{args.pages} pages, {args.latency_ms:.0f} ms each,"
+        f" capacity {args.capacity or 'unlimited'}, crawl-delay {args.crawl_delay or 'none'}"
+    )
+    runs = [] if args.skip_loader else [("SitemapLoader rps=2", run_sitemap_loader, {})]
+    for rates in args.rates.split(","):
+        rate, max_rate = (float(r) for r in rates.split(":"))
+        runs.append(
+            (
+                f"crawler {rate:g}->{max_rate:g}/s",
+                run_crawler,
+                {"concurrency": args.concurrency, "rate": rate, "max_rate": max_rate},
+            )
+        )
+    for name, run, kwargs in runs:
+        with FakeSiteServer(
+            pages=args.pages,
+            latency=args.latency_ms / 1000,
+            capacity=args.capacity,
+            crawl_delay=args.crawl_delay,
+        ) as server:
+            try:
+                count, first, seconds, extra = run(server, **kwargs)
+            except ImportError as e:
+                print(f"{name:>22}: skipped ({e})")
+                continue
+            print(
+                f"{name:>22}: {count} pages in {seconds:7.2f} s  {count / seconds:7.1f} pages/s"
+                f"  first page {first:6.2f} s  connections {server.connections}" + extra
+            )
+
+
+if __name__ == "__main__":
+    main()
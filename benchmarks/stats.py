@@ -0,0 +1,12 @@
+# Small helpers shared by the benchmark scripts.
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:8.2f} ms"
@@ -0,0 +1,104 @@
+# Lazily initialized search backend for ChefGPT.
+#
+# Nothing connects at import time, so a slow or failing Pinecone never keeps
+# a worker from booting. The backend initializes in the background (retrying
+# with backoff), /ready reports when it can serve, and requests that arrive
+# early wait for it up to a timeout.
+
+import asyncio
+import time
+
+from chef.query_embedder import QueryEmbedder
+
+# set as early as possible so cold start includes imports
+PROCESS_STARTED = time.perf_counter()
+
+
+class BackendNotReady(Exception):
+    pass
+
+
+class SearchBackend:
+    def __init__(self, factory, retry_delay=1.0, max_retry_delay=30.0):
+        # factory is a blocking callable returning (vector_store, ingredient_index)
+        self.factory = factory
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.vector_store = None
+        self.ingredient_index = None
+        self.query_embedder = None
+        self.ready = False
+        self.warmed = False
+        self.error = None
+        self.attempts = 0
+        self.timings = {}
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._initialize())
+        return self._task
+
+    async def _initialize(self):
+        delay = self.retry_delay
+        started = time.perf_counter()
+        while True:
+            self.attempts += 1
+            try:
+                self.vector_store, self.ingredient_index = await asyncio.to_thread(
+                    self.factory
+                )
+                break
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"Search backend failed to start, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+        self.query_embedder = QueryEmbedder(self.vector_store.embeddings)
+        self.error = None
+        self.ready = True
+        self.timings["init_seconds"] = time.perf_counter() - started
+        self.timings["ready_after_boot_seconds"] = time.perf_counter() - PROCESS_STARTED
+
+    async def wait_ready(self, timeout=10.0):
+        if self.ready:
+            return self
+        if self.error is not None:
+            # already failed at least once, don't hold the request while it retries
+            raise BackendNotReady(self.error)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.start()), timeout)
+        except asyncio.TimeoutError:
+            raise BackendNotReady(self.error or "Search backend is still starting")
+        return self
+
+    async def warm_up(self, queries):
+        """Fault the index into memory and embed the most common queries."""
+        await asyncio.shield(self.start())
+        started = time.perf_counter()
+        preload = getattr(self.vector_store, "preload", None)
+        if preload is not None:
+            await asyncio.to_thread(preload)
+        results = await asyncio.gather(
+            *[self.query_embedder.embed(query) for query in queries],
+            return_exceptions=True,
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        self.warmed = True
+        self.timings["warmup_seconds"] = time.perf_counter() - started
+        self.timings["warmup_queries"] = len(queries) - failed
+
+    def mark_served(self):
+        if "first_request_after_boot_seconds" not in self.timings:
+            cold_start = time.perf_counter() - PROCESS_STARTED
+            self.timings["first_request_after_boot_seconds"] = cold_start
+            print(f"Cold start: first request served {cold_start:.3f}s after boot")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "warmed": self.warmed,
+            "attempts": self.attempts,
+            "error": self.error,
+            "timings": self.timings,
+        }
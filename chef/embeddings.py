@@ -0,0 +1,48 @@
+# Local embedding stand-in for ChefGPT.
+# It doesn't call OpenAI, so we can build and query the recipe index offline
+# and get the same vector for the same text every time (good for testing).
+
+import hashlib
+import re
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashing bag of words, L2 normalized.
+
+    Texts that share words end up close to each other, which is enough to
+    make "kimchi" find kimchi recipes without a model.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+
+    def _bucket(self, token):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        # lowest bit picks the sign so collisions cancel out instead of piling up
+        return (value >> 1) % self.size, 1.0 if value & 1 else -1.0
+
+    def embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in tokenize(text):
+            index, sign = self._bucket(token)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_documents(self, texts):
+        return [self.embed(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed(text).tolist()
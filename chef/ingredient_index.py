@@ -0,0 +1,186 @@
+# Ingredient inverted index for ChefGPT.
+#
+# Most /recipes queries are just ingredient names, and for those a plain
+# keyword lookup over the ingredient lists is both cheaper and more precise
+# than a dense search. Recipes are scored with BM25 and queries can combine
+# ingredients:
+#
+#   "kimchi, tofu"       recipes with kimchi AND tofu
+#   "kimchi or tofu"     recipes with either
+#   "soy sauce + rice"   AND again ("and", ",", "+" and "&" all mean AND)
+#
+# hybrid_search() fuses these results with the vector results and skips the
+# embedding call completely when the keyword match alone can answer.
+
+import math
+import re
+from collections import Counter, defaultdict
+
+from chef.embeddings import tokenize
+from chef.local_index import read_recipes, recipe_to_document
+
+OR_RE = re.compile(r"\s+or\s+|\|", re.IGNORECASE)
+AND_RE = re.compile(r"\s+and\s+|[,+&]", re.IGNORECASE)
+
+# words that show up in ingredient lists but aren't ingredients
+STOPWORDS = {
+    "a", "an", "and", "as", "at", "for", "from", "in", "into", "of", "on",
+    "or", "the", "to", "with", "your", "optional", "ingredients", "ingredient",
+    "tsp", "tbsp", "teaspoon", "tablespoon", "cup", "g", "kg", "ml", "l", "oz",
+    "lb", "pinch", "handful", "large", "small", "medium", "chopped", "sliced",
+    "diced", "finely", "roughly", "fresh", "freshly", "about", "plus", "extra",
+}  # fmt: skip
+
+
+def stem(token):
+    if len(token) <= 3:
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith("oes"):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize_terms(text):
+    terms = []
+    for token in tokenize(text):
+        if any(c.isdigit() for c in token):
+            continue
+        token = stem(token)
+        if token not in STOPWORDS:
+            terms.append(token)
+    return terms
+
+
+def ingredient_lines(ingredients):
+    for line in ingredients.splitlines():
+        line = line.strip()
+        if line and line.lower() != "ingredients":
+            yield line
+
+
+def parse_query(query):
+    """Turn a query into OR groups of AND-ed terms.
+
+    >>> parse_query("kimchi, tofu or soy sauce")
+    [['kimchi', 'tofu'], ['soy', 'sauce']]
+    """
+    groups = []
+    for part in OR_RE.split(query):
+        terms = []
+        for ingredient in AND_RE.split(part):
+            for term in normalize_terms(ingredient):
+                if term not in terms:
+                    terms.append(term)
+        if terms:
+            groups.append(terms)
+    return groups
+
+
+class IngredientIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.lengths = []
+        self.total_length = 0
+        # term -> {doc id: term frequency}
+        self.postings = defaultdict(dict)
+
+    @classmethod
+    def from_csv(cls, csv_path, **kwargs):
+        index = cls(**kwargs)
+        for row in read_recipes(csv_path):
+            index.add(recipe_to_document(row), row["ingredients"])
+        return index
+
+    def add(self, document, ingredients):
+        doc_id = len(self.documents)
+        terms = []
+        for line in ingredient_lines(ingredients):
+            terms.extend(normalize_terms(line))
+        self.documents.append(document)
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self.postings[term][doc_id] = count
+        return doc_id
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def average_length(self):
+        return self.total_length / len(self) if self.documents else 0.0
+
+    def idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self) - n + 0.5) / (n + 0.5))
+
+    def match(self, groups):
+        matched = set()
+        for terms in groups:
+            postings = [self.postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            if not postings or not postings[0]:
+                continue
+            ids = set(postings[0])
+            for other in postings[1:]:
+                ids.intersection_update(other)
+            matched |= ids
+        return matched
+
+    def score(self, doc_id, terms):
+        average = self.average_length or 1.0
+        length = self.lengths[doc_id]
+        total = 0.0
+        for term in terms:
+            tf = self.postings.get(term, {}).get(doc_id)
+            if not tf:
+                continue
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average)
+            total += self.idf(term) * tf * (self.k1 + 1) / norm
+        return total
+
+    def search_with_score(self, query, k=4):
+        groups = parse_query(query)
+        terms = {term for group in groups for term in group}
+        scored = [(self.score(i, terms), i) for i in self.match(groups)]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(self.documents[i], score) for score, i in scored[:k]]
+
+    def search(self, query, k=4):
+        return [doc for doc, _ in self.search_with_score(query, k)]
+
+
+def document_key(document):
+    return document.metadata.get("href") or document.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k=4, c=60):
+    """Merge ranked lists of documents, rewarding those ranked high anywhere."""
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document_key(document)
+            scores[key] += 1.0 / (c + rank + 1)
+            documents.setdefault(key, document)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+
+async def hybrid_search(query, ingredient_index, vector_search, k=4):
+    """Keyword first, vectors only when the keyword match isn't enough.
+
+    vector_search is an async callable (query, k) -> documents, so the caller
+    decides how the query gets embedded. Returns (documents, used_vectors).
+    """
+    lexical = ingredient_index.search(query, k)
+    if len(lexical) >= k:
+        return lexical, False
+    dense = await vector_search(query, k)
+    return reciprocal_rank_fusion([lexical, dense], k), True
@@ -0,0 +1,243 @@
+# Offline recipe index for ChefGPT.
+#
+# recipes.csv embedded once and kept on disk, so /recipes can be answered
+# without asking Pinecone:
+#
+#   vectors.npy   float32 matrix (one normalized row per recipe), memory-mapped
+#   docs.jsonl    one {"page_content", "metadata"} object per line
+#   offsets.npy   byte offset of every line in docs.jsonl (+ the file size)
+#   meta.json     count, dimension and which embeddings built the index
+#
+# Loading only maps the files, so startup takes milliseconds no matter how big
+# the index is, and the OS shares the pages between worker processes.
+#
+# Build it with:
+#   python -m chef.local_index --csv recipes.csv --out ./.cache/recipe_index
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import shutil
+import sys
+
+import numpy as np
+from langchain.schema import Document
+
+from chef.embeddings import HashingEmbeddings
+
+DEFAULT_INDEX_PATH = "./.cache/recipe_index"
+
+# recipes.csv has a few very long preparation fields
+csv.field_size_limit(sys.maxsize)
+
+
+def recipe_to_document(row):
+    title = row["title"].strip()
+    ingredients = row["ingredients"].strip()
+    preparation = row["preparation"].strip()
+    return Document(
+        page_content=f"{title}\n\n{ingredients}\n\n{preparation}",
+        metadata={"title": title, "href": row["href"].strip()},
+    )
+
+
+def read_recipes(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def load_recipes(csv_path):
+    for row in read_recipes(csv_path):
+        yield recipe_to_document(row)
+
+
+def count_recipes(csv_path):
+    return sum(1 for _ in read_recipes(csv_path))
+
+
+def build_index(csv_path, out_dir, embeddings, batch_size=256):
+    """Embed every recipe in csv_path and write the index files to out_dir.
+
+    The index is written next to out_dir first and swapped in at the end, so a
+    running server never sees a half written index.
+    """
+    count = count_recipes(csv_path)
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    vectors = None
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    position = 0
+    batch = []
+
+    def flush(start):
+        nonlocal vectors
+        embedded = np.asarray(
+            embeddings.embed_documents([doc.page_content for doc in batch]),
+            dtype=np.float32,
+        )
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, "vectors.npy"),
+                mode="w+",
+                dtype=np.float32,
+                shape=(count, embedded.shape[1]),
+            )
+        norms = np.linalg.norm(embedded, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors[start : start + len(batch)] = embedded / norms
+        batch.clear()
+
+    with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as docs_file:
+        for i, doc in enumerate(load_recipes(csv_path)):
+            line = json.dumps(
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+            ).encode("utf-8")
+            docs_file.write(line + b"\n")
+            offsets[i] = position
+            position += len(line) + 1
+            batch.append(doc)
+            if len(batch) == batch_size:
+                flush(i + 1 - len(batch))
+        if batch:
+            flush(count - len(batch))
+    offsets[count] = position
+
+    dimension = 0
+    if vectors is not None:
+        dimension = vectors.shape[1]
+        vectors.flush()
+        del vectors
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "count": count,
+                "dimension": dimension,
+                "embeddings": type(embeddings).__name__,
+            },
+            f,
+        )
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return count
+
+
+class LocalRecipeIndex:
+    """In-process replacement for the Pinecone vector store.
+
+    Has the same `similarity_search` signature, so get_recipe doesn't care
+    which one it's talking to.
+    """
+
+    def __init__(self, path, embeddings):
+        self.path = path
+        self.embeddings = embeddings
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        if self.meta["count"]:
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self._docs = mmap.mmap(
+                self._docs_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+            self._docs = b""
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self._docs_file.close()
+
+    def preload(self):
+        """Read every page of the index once so the first searches don't fault."""
+        if len(self):
+            np.add.reduce(self.vectors, axis=0)
+            self._docs.madvise(mmap.MADV_WILLNEED)
+
+    def get_document(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        data = json.loads(self._docs[start:end])
+        return Document(**data)
+
+    def search_vector(self, vector, k=4):
+        """Return (row ids, cosine scores) of the k closest recipes."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        ids, scores = self.search_vector(embedding, k)
+        return [(self.get_document(i), float(s)) for i, s in zip(ids, scores)]
+
+    # Pinecone's name for it, so ChefGPT can search either store the same way
+    def similarity_search_by_vector_with_score(self, embedding, *, k=4):
+        return self.similarity_search_with_score_by_vector(embedding, k)
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        ids, _ = self.search_vector(embedding, k)
+        return [self.get_document(i) for i in ids]
+
+    def similarity_search_with_score(self, query, k=4):
+        embedding = self.embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k)
+
+    def similarity_search(self, query, k=4):
+        embedding = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k)
+
+
+def get_embeddings(name):
+    if name in ("hashing", HashingEmbeddings.__name__):
+        return HashingEmbeddings()
+    from langchain.embeddings import OpenAIEmbeddings
+
+    return OpenAIEmbeddings()
+
+
+def load_index(path=DEFAULT_INDEX_PATH, embeddings=None):
+    """Open an index, querying it with the same embeddings that built it."""
+    if embeddings is None:
+        with open(os.path.join(path, "meta.json")) as f:
+            embeddings = get_embeddings(json.load(f)["embeddings"])
+    return LocalRecipeIndex(path, embeddings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local recipe index.")
+    parser.add_argument("--csv", default="recipes.csv")
+    parser.add_argument("--out", default=DEFAULT_INDEX_PATH)
+    parser.add_argument(
+        "--embeddings",
+        choices=["openai", "hashing"],
+        default="openai",
+        help="hashing is a deterministic offline stand-in for testing",
+    )
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    count = build_index(
+        args.csv, args.out, get_embeddings(args.embeddings), args.batch_size
+    )
+    print(f"Indexed {count} recipes into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Query embedding for /recipes.
+#
+# Most ingredient queries are repeats ("kimchi", "tofu"), so rather than one
+# embedding round-trip per request we:
+#   1. answer from an LRU of query vectors when we've seen the query before,
+#   2. let identical queries that arrive together wait on the same future,
+#   3. collect the distinct ones for a few milliseconds and embed them in a
+#      single embed_documents call.
+
+import asyncio
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class QueryEmbedder:
+    def __init__(self, embeddings, window=0.005, max_batch_size=64, cache_size=4096):
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.pending = []
+        self._timer = None
+        self.stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "batches": 0,
+            "embedded": 0,
+        }
+
+    def _remember(self, key, vector):
+        self.cache[key] = vector
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def embed(self, text):
+        key = normalize_query(text)
+        self.stats["requests"] += 1
+
+        if key in self.cache:
+            self.stats["cache_hits"] += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        self.pending.append(key)
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush
+            )
+        # shield so one cancelled request doesn't cancel the others waiting on it
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        keys, self.pending = self.pending, []
+        asyncio.get_running_loop().create_task(self._embed_batch(keys))
+
+    async def _embed_batch(self, keys):
+        self.stats["batches"] += 1
+        self.stats["embedded"] += len(keys)
+        try:
+            vectors = await self.embeddings.aembed_documents(keys)
+        except Exception as e:
+            for key in keys:
+                future = self.in_flight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+            future = self.in_flight.pop(key)
+            if not future.done():
+                future.set_result(vector)
@@ -0,0 +1,40 @@
+# Counts which ingredients people ask for, so warm-up can embed the popular
+# ones before the first request needs them.
+
+import json
+import os
+from collections import Counter
+
+from chef.query_embedder import normalize_query
+
+DEFAULT_HISTORY_PATH = "./.cache/chef_query_history.json"
+
+
+class QueryHistory:
+    def __init__(self, path=DEFAULT_HISTORY_PATH, save_every=100):
+        self.path = path
+        self.save_every = save_every
+        self.counts = Counter()
+        self._unsaved = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                self.counts.update(json.load(f))
+
+    def record(self, query):
+        self.counts[normalize_query(query)] += 1
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def top(self, n):
+        return [query for query, _ in self.counts.most_common(n)]
+
+    def save(self):
+        if not self._unsaved:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(self.counts), f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
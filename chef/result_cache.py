@@ -0,0 +1,89 @@
+# Server-side cache of /recipes search results.
+#
+# A search is run once per normalized query (to `depth` results) and every
+# page, projection and repeat call after that is sliced from the cached list.
+# Pages get an ETag from the recipes they contain, so clients can revalidate
+# without downloading the page again.
+
+import base64
+import binascii
+import hashlib
+import time
+from collections import OrderedDict
+
+from chef.ingredient_index import document_key, parse_query
+from chef.query_embedder import normalize_query
+
+
+def cache_key(query):
+    """Normalize so "Tofu, Kimchi" and "kimchi,tofu" share one entry."""
+    groups = parse_query(query)
+    if not groups:
+        return normalize_query(query)
+    return "|".join(sorted(",".join(sorted(group)) for group in groups))
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the offset, or raises ValueError for a cursor we didn't make."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, offset = base64.urlsafe_b64decode(padded).decode().split(":")
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if prefix != "o" or not offset.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(offset)
+
+
+def page_etag(documents, *parts):
+    """Weak ETag for one page: changes when its recipes or the parameters do."""
+    digest = hashlib.sha1()
+    for value in [*map(document_key, documents), *map(str, parts)]:
+        digest.update(value.encode("utf-8"))
+        digest.update(b"\0")
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
+class CachedResult:
+    def __init__(self, documents, depth):
+        self.documents = documents
+        self.depth = depth
+        self.created = time.monotonic()
+
+    @property
+    def exhausted(self):
+        """True when the search found fewer results than it was asked for."""
+        return len(self.documents) < self.depth
+
+
+class ResultCache:
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry.created > self.ttl:
+            self.entries.pop(key, None)
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key, documents, depth):
+        entry = CachedResult(documents, depth)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
@@ -1,20 +1,35 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
 from langchain.text_splitter import CharacterTextSplitter
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.storage import LocalFileStore
+from langchain.embeddings import OpenAIEmbeddings
 from langchain.chat_models import ChatOpenAI
 from langchain.callbacks.base import BaseCallbackHandler
 
 from langchain.memory import ConversationSummaryBufferMemory
-from langchain.schema import messages_from_dict, messages_to_dict
+from langchain.schema import AIMessage, HumanMessage
+
+from utils.background_memory import BackgroundSummaryMemory
+from utils.chat_journal import SESSION_ID_RE, ChatJournal
+from utils.context_packer import pack_context
+from utils.corpus import ShardedCorpus
+from utils.embedding_cache import MAX_BYTES, ContentAddressedEmbeddings
+from utils.faiss_store import (
+    corpus_key,
+    index_exists,
+    index_path,
+    load_vectorstore,
+    save_vectorstore,
+)
+from utils.ingest import STAGES, IngestJob, stream_to_disk
+from utils.quantized_index import convert_vectorstore
+from utils.registry import get_chain, get_model, get_resource
+from utils.semantic_cache import answer_scope, open_answer_cache
+from utils.sqlite_store import open_store
 
-from operator import itemgetter
 import streamlit as st
-import os
-import json
+import threading
+import time
+import uuid
 
 st.set_page_config(
     page_title="DocumentGPT",
@@ -37,55 +52,94 @@ class ChatCallbackHandler(BaseCallbackHandler):
         self.message_box.markdown(self.message)
         
         
-llm = ChatOpenAI(
-    temperature=0.1,
-    streaming=True,
-    callbacks=[
-        ChatCallbackHandler(), 
-    ],
-)
+# one per process, shared by every session (utils/registry.py)
+llm = get_model(ChatOpenAI, temperature=0.1, streaming=True)
+
+memory_llm = get_model(ChatOpenAI, temperature=0.1)
 
-memory_llm = ChatOpenAI(
-    temperature=0.1,
+# Paraphrases of a question already answered about the same file get the
+# earlier answer back (utils/semantic_cache.py).
+answer_cache = open_answer_cache(
+    "./.cache/answers.db", get_resource("openai_embeddings", OpenAIEmbeddings)
 )
 
 
+# old turns are summarized after the answer (utils/background_memory.py)
 if "memory" not in st.session_state:
-    st.session_state["memory"] = ConversationSummaryBufferMemory(
-        llm=memory_llm,
-        max_token_limit=120,
-        memory_key="chat_history",
-        return_messages=True,
+    st.session_state["memory"] = BackgroundSummaryMemory(
+        ConversationSummaryBufferMemory(
+            llm=memory_llm,
+            max_token_limit=120,
+            memory_key="chat_history",
+            return_messages=True,
+        )
     )
 
 
-@st.cache_data(show_spinner="Embedding file...")
+@st.cache_resource(show_spinner="Preparing file...")
+def save_upload(file):
+    file_path, file_hash = stream_to_disk(file, "./.cache/files")
+    key = corpus_key(file_hash, "CharacterTextSplitter", 300, 100, OpenAIEmbeddings().model)
+    return file_path, key
+
+
+# One job per file content, shared by every session. A failed one is
+# forgotten (forget_job), so the next run indexes that file again.
+ingest_jobs = get_resource("document_ingest_jobs", dict)
+ingest_jobs_lock = get_resource("document_ingest_jobs_lock", threading.Lock)
+
+
 def embed_file(file):
-    file_content = file.read()
-    file_path = f"./.cache/files/{file.name}"
-    
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-        
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
+    file_path, key = save_upload(file)
+    with ingest_jobs_lock:
+        if key not in ingest_jobs:
+            ingest_jobs[key] = start_job(file_path, key)
+        return ingest_jobs[key], key
+
+
+def forget_job(key, job):
+    with ingest_jobs_lock:
+        if ingest_jobs.get(key) is job:
+            del ingest_jobs[key]
+
+
+# Embeddings are cached per chunk (utils/embedding_cache.py) and indexes per
+# file content (utils/faiss_store.py); a new file is indexed in the background
+# and can be asked about while that's still going (utils/ingest.py).
+def start_job(file_path, key):
+    cache_dir = open_store("./.cache/embeddings.db", max_bytes=MAX_BYTES)
     splitter = CharacterTextSplitter.from_tiktoken_encoder(
         separator="\n",
         chunk_size=300,
         chunk_overlap=100,
     )
-    
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings()
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    cached_embeddings = ContentAddressedEmbeddings(OpenAIEmbeddings(), cache_dir)
+    path = index_path(key)
+    if index_exists(path):
+        vectorstore = load_vectorstore(path, cached_embeddings)
+        return IngestJob.from_vectorstore(vectorstore, cached_embeddings)
+    job = IngestJob(
+        file_path,
+        splitter,
+        cached_embeddings,
+        # indexed flat while uploading, saved as whatever index suits its
+        # size (utils/quantized_index.py) for the next time it's loaded
+        on_complete=lambda vectorstore: save_vectorstore(
+            convert_vectorstore(vectorstore, "auto"), path
+        ),
+    )
+    return job.start()
+
 
+def paint_progress(job, name):
+    st.caption(name)
+    for stage in STAGES:
+        done, total = job.progress[stage]
+        st.progress(
+            done / total if total else 0.0,
+            text=f"{stage.capitalize()}: {done}/{total}",
+        )
 
-def load_json(path):
-    with open(path, "r") as f:
-        return json.load(f)
 
 # message is what either user or ai writes.
 def save_message(message, role):
@@ -96,14 +150,24 @@ def save_memory(input, output):
     st.session_state["chat_history"].append({"input": input, "output": output})
     
     
-def save_memory_on_file(memory_file_path):
-    print("work save memory on file")
-    history = st.session_state["memory"].chat_memory.messages
-    history = messages_to_dict(history)
-    
-    with open(memory_file_path, "w") as f:
-        json.dump(history, f)
-        
+# Each browser chat gets its own id in the URL (?chat=...), so reloading the
+# page finds its journal again and two users never share one.
+def get_chat_session_id():
+    session_id = st.experimental_get_query_params().get("chat", [""])[0]
+    if not SESSION_ID_RE.match(session_id):
+        session_id = uuid.uuid4().hex
+        st.experimental_set_query_params(chat=session_id)
+    return session_id
+
+
+def save_memory_on_journal(input, output):
+    memory = st.session_state["memory"]
+    memory.save_context({"input": input}, {"output": output})
+    st.session_state["journal"].append_turn(
+        HumanMessage(content=input), AIMessage(content=output), memory
+    )
+
+
 def restore_memory():
     print("working restore memory")
     for history in st.session_state["chat_history"]:
@@ -127,27 +191,55 @@ def paint_history():
             save=False,
         )
 
+# Neighbouring chunks overlap by 100 tokens, pack_context drops the repeated
+# text and keeps the context under a token budget (utils/context_packer.py).
 def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
-
-
-def invoke_chain(message):
-    # invoke the chain
-    result = chain.invoke(message)
+    return pack_context(docs, max_tokens=1200)
+
+
+def invoke_chain(message, retriever, scope=None):
+    # scope is None while the file is still being indexed, those answers
+    # only saw part of it and aren't cached
+    answer, vector = None, None
+    if scope is not None:
+        answer, vector = answer_cache.get(scope, message)
+    if answer is not None:
+        st.markdown(answer)
+        save_message(answer, "ai")
+    else:
+        # invoke the chain, with this session's file, history and message box
+        memory = st.session_state["memory"]
+        result = chain.invoke(
+            {
+                "question": message,
+                "retriever": retriever,
+                "chat_history": memory.load_memory_variables({})["chat_history"],
+            },
+            {"callbacks": [ChatCallbackHandler()]},
+        )
+        answer = result.content
+        if scope is not None:
+            answer_cache.put(scope, message, answer, vector)
     # save the interaction in the memory
-    save_memory(message, result.content)
+    save_memory(message, answer)
+    save_memory_on_journal(message, answer)
     
     
-def load_memory_from_file(memory_file_path):
-    print("work load memory from file")
-    loaded_message = load_json(memory_file_path)
-    history = messages_from_dict(loaded_message)
+# only once per session, not on every rerun
+def load_memory_from_journal():
+    if st.session_state.get("memory_loaded"):
+        return
+    summary, history = st.session_state["journal"].load()
+    st.session_state["memory"].moving_summary_buffer = summary
     st.session_state["memory"].chat_memory.messages = history
+    st.session_state["memory_loaded"] = True
 
 
 
-prompt = ChatPromptTemplate.from_messages(
-    [
+prompt = get_resource(
+    "document_qa_prompt",
+    ChatPromptTemplate.from_messages,
+    messages=[
         (
             "system",
             """
@@ -158,10 +250,27 @@ prompt = ChatPromptTemplate.from_messages(
             """,
         ),
         ("human","{question}"),
-    ]
+    ],
 )
 
 
+def retrieve(inputs, config):
+    return inputs["retriever"].invoke(inputs["question"], config)
+
+
+def build_chain(llm, prompt):
+    return (
+        RunnablePassthrough.assign(
+            context=RunnableLambda(retrieve) | RunnableLambda(format_docs)
+        )
+        | prompt
+        | llm
+    )
+
+
+chain = get_chain("document_qa", build_chain, llm=llm, prompt=prompt)
+
+
 
 st.title("DocumentGPT")
 
@@ -175,28 +284,52 @@ Upload your files on the sidebar.
 """)
       
 with st.sidebar:  
-    file = st.file_uploader(
-        "Upload a .txt .pdf or .docx file", 
+    files = st.file_uploader(
+        "Upload .txt .pdf or .docx files", 
         type=["pdf", "txt", "docx"],
+        accept_multiple_files=True,
     )
-    memory_checkbox = None
-    memory_file_path = "./.cache/chat_memory/memory.json"
-    if os.path.exists(memory_file_path):
+    if "journal" not in st.session_state:
+        st.session_state["journal"] = ChatJournal(get_chat_session_id())
+    if st.session_state["journal"].exists():
         memory_checkbox = st.checkbox(
             "Do you want to keep your previous chat?", value=True
         )
         if memory_checkbox:
-            load_memory_from_file(memory_file_path)
+            load_memory_from_journal()
 
-if file:
-    if memory_checkbox:
-        # Load memory
-        memory_dict = load_json(memory_file_path)
-    
-    retriever = embed_file(file)
-    send_message("I'm ready! Ask away!", "ai", save=False)
+# one shard per file (utils/corpus.py)
+if "corpus" not in st.session_state:
+    st.session_state["corpus"] = ShardedCorpus(
+        get_resource("openai_embeddings", OpenAIEmbeddings)
+    )
+corpus = st.session_state["corpus"]
+
+if files:
+    jobs = {}
+    for file in files:
+        job, key = embed_file(file)
+        jobs[key] = (job, file.name)
+        if job.error is not None:
+            # whatever it indexed before failing shouldn't answer questions
+            corpus.remove(key)
+        elif key not in corpus:
+            corpus.add(key, job, file.name)
+    corpus.sync(jobs)
+    retriever = corpus.as_retriever()
+    indexed = all(job.done.is_set() for job, _ in jobs.values())
+    with st.sidebar:
+        progress_box = st.empty()
+    if indexed:
+        send_message("I'm ready! Ask away!", "ai", save=False)
+    else:
+        send_message(
+            "I'm still reading your files, but you can already ask about the pages I've indexed!",
+            "ai",
+            save=False,
+        )
     paint_history()
-    message = st.chat_input("Ask anything about your file...")
+    message = st.chat_input("Ask anything about your files...")
     if message:
         send_message(message, "human")
         
@@ -210,25 +343,11 @@ if file:
         # prompts = prompt.format_messages(context=docs, question=message)
         # llm.predict_messages(prompts)
         
-        chain = (
-        {
-            "context": retriever | RunnableLambda(format_docs),
-            "question": RunnablePassthrough(),
-        } 
-        | RunnablePassthrough.assign(
-            chat_history=RunnableLambda(
-                st.session_state["memory"].load_memory_variables
-            )
-            | itemgetter("chat_history")
-        )
-        | prompt 
-        | llm
-        )
         with st.chat_message("ai"):
-            invoke_chain(message)
-            
-        if len(st.session_state["memory"].chat_memory.messages) != 0:
-            save_memory_on_file(memory_file_path=memory_file_path)
+            scope = None
+            if indexed and all(job.error is None for job, _ in jobs.values()):
+                scope = answer_scope(corpus.key, prompt, llm)
+            invoke_chain(message, retriever, scope)
         
         # search for the documents on our own, format the documents, then format the prompt,
         # give the prompt formateted to the llm.
@@ -237,7 +356,44 @@ if file:
         # Langchain will automatically run retriever from the user input.
         # input from the user: chain.invoke(message)
         
+    # keep the indexing progress moving until it's done,
+    # sending a message reruns the script and ends this loop
+    while not all(job.done.is_set() for job, _ in jobs.values()):
+        with progress_box.container():
+            for job, name in jobs.values():
+                if not job.done.is_set():
+                    paint_progress(job, name)
+        time.sleep(0.5)
+    with progress_box.container():
+        built = [job for job, _ in jobs.values() if job.file_path is not None]
+        for key, (job, name) in jobs.items():
+            if job.error is not None:
+                corpus.remove(key)
+                forget_job(key, job)
+                st.error(f"Indexing {name} failed: {job.error}")
+        if len(built) < len(jobs):
+            st.caption(f"Loaded the saved index for {len(jobs) - len(built)} of {len(jobs)} files.")
+        if built:
+            stats = [job.embeddings.stats for job in built]
+            st.caption(
+                f"Reused {sum(s['hits'] for s in stats)} of {sum(s['chunks'] for s in stats)} "
+                f"chunk embeddings, embedded {sum(s['embedded'] for s in stats)} new ones."
+            )
+        memory_stats = st.session_state["memory"].stats
+        if memory_stats["summaries"]:
+            st.caption(
+                f"Summarized the chat {memory_stats['summaries']} times in the background "
+                f"({memory_stats['summary_tokens']} tokens, ${memory_stats['summary_cost']:.4f}), "
+                f"memory loads took {memory_stats['load_seconds'] * 1000:.1f} ms in total."
+            )
+        if answer_cache.stats["lookups"]:
+            st.caption(
+                f"Answered {answer_cache.stats['hits']} of {answer_cache.stats['lookups']} "
+                f"questions from the answer cache ({answer_cache.hit_rate:.0%})."
+            )
+        
 else:
+    corpus.sync([])
     st.session_state["messages"] = []
     st.session_state["chat_history"] = []
 
@@ -7,14 +7,20 @@
 
 from langchain.prompts import ChatPromptTemplate
 from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import CacheBackedEmbeddings, OllamaEmbeddings
+from langchain.embeddings import OllamaEmbeddings
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
 from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
 from langchain.chat_models import ChatOllama
 from langchain.callbacks.base import BaseCallbackHandler
+from utils.context_packer import pack_context
+from utils.corpus import ShardedCorpus
+from utils.embedding_cache import MAX_BYTES, ContentAddressedEmbeddings
+from utils.faiss_store import corpus_key, load_or_build
+from utils.parallel_embeddings import ParallelEmbeddings
+from utils.registry import get_chain, get_model, get_resource
+from utils.sqlite_store import open_store
 import streamlit as st
+import os
 
 st.set_page_config(
     page_title="PrivateGPT",
@@ -36,35 +42,43 @@ class ChatCallbackHandler(BaseCallbackHandler):
         self.message_box.markdown(self.message)
 
 
-llm = ChatOllama(
-    model="llama2:latest",
-    temperature=0.1,
-    streaming=True,
-    callbacks=[
-        ChatCallbackHandler(),
-    ],
-)
+# one per process, shared by every session (utils/registry.py)
+llm = get_model(ChatOllama, model="llama2:latest", temperature=0.1, streaming=True)
 
 
-@st.cache_data(show_spinner="Embedding file...")
+# indexes are saved per file content (utils/faiss_store.py)
+@st.cache_resource(show_spinner="Embedding file...")
 def embed_file(file):
     file_content = file.read()
     file_path = f"./.cache/private_files/{file.name}"
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    cache_dir = LocalFileStore(f"./.cache/private_embeddings/{file.name}")
+    cache_dir = open_store("./.cache/private_embeddings.db", max_bytes=MAX_BYTES)
     splitter = CharacterTextSplitter.from_tiktoken_encoder(
         separator="\n",
         chunk_size=600,
         chunk_overlap=100,
     )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
     embeddings = OllamaEmbeddings(model="llama2:latest")
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    # Ollama embeds one chunk per request, so keep a few requests in flight
+    # (utils/parallel_embeddings.py) instead of waiting on each one in turn
+    parallel_embeddings = ParallelEmbeddings(
+        embeddings,
+        workers=int(os.getenv("OLLAMA_EMBED_WORKERS", "4")),
+        batch_size=int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "8")),
+    )
+    cached_embeddings = ContentAddressedEmbeddings(parallel_embeddings, cache_dir)
+
+    def load_docs():
+        with open(file_path, "wb") as f:
+            f.write(file_content)
+        loader = UnstructuredFileLoader(file_path)
+        return loader.load_and_split(text_splitter=splitter)
+
+    key = corpus_key(file_content, "CharacterTextSplitter", 600, 100, embeddings.model)
+    # 4096 float32s a chunk add up, the index is kept int8-quantized by default
+    # and re-ranked against the exact vectors on disk (utils/quantized_index.py)
+    index_type = os.getenv("PRIVATE_INDEX_TYPE", "sq8")
+    vectorstore = load_or_build(key, cached_embeddings, load_docs, index_type=index_type)
+    return vectorstore, key
 
 
 def save_message(message, role):
@@ -87,19 +101,40 @@ def paint_history():
         )
 
 
+# llama2 only has a 4k context, so the retrieved chunks are packed into 2000
+# tokens without the text neighbouring chunks share (utils/context_packer.py).
 def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
+    return pack_context(docs, max_tokens=2000)
 
 
-prompt = ChatPromptTemplate.from_template(
-    """Answer the question using ONLY the following context and not your training data. If you don't know the answer just say you don't know. DON'T make anything up.
+prompt = get_resource(
+    "private_qa_prompt",
+    ChatPromptTemplate.from_template,
+    template="""Answer the question using ONLY the following context and not your training data. If you don't know the answer just say you don't know. DON'T make anything up.
     
     Context: {context}
     Question:{question}
-    """
+    """,
 )
 
 
+def retrieve(inputs, config):
+    return inputs["retriever"].invoke(inputs["question"], config)
+
+
+def build_chain(llm, prompt):
+    return (
+        RunnablePassthrough.assign(
+            context=RunnableLambda(retrieve) | RunnableLambda(format_docs)
+        )
+        | prompt
+        | llm
+    )
+
+
+chain = get_chain("private_qa", build_chain, llm=llm, prompt=prompt)
+
+
 st.title("PrivateGPT")
 
 st.markdown(
@@ -113,29 +148,40 @@ Upload your files on the sidebar.
 )
 
 with st.sidebar:
-    file = st.file_uploader(
-        "Upload a .txt .pdf or .docx file",
+    files = st.file_uploader(
+        "Upload .txt .pdf or .docx files",
         type=["pdf", "txt", "docx"],
+        accept_multiple_files=True,
     )
 
-if file:
-    retriever = embed_file(file)
+# one shard per file (utils/corpus.py)
+if "corpus" not in st.session_state:
+    st.session_state["corpus"] = ShardedCorpus(
+        get_resource("ollama_embeddings", OllamaEmbeddings, model="llama2:latest")
+    )
+corpus = st.session_state["corpus"]
+
+if files:
+    keys = []
+    for file in files:
+        vectorstore, key = embed_file(file)
+        keys.append(key)
+        if key not in corpus:
+            corpus.add(key, vectorstore, file.name)
+    corpus.sync(keys)
+    retriever = corpus.as_retriever()
     send_message("I'm ready! Ask away!", "ai", save=False)
     paint_history()
-    message = st.chat_input("Ask anything about your file...")
+    message = st.chat_input("Ask anything about your files...")
     if message:
         send_message(message, "human")
-        chain = (
-            {
-                "context": retriever | RunnableLambda(format_docs),
-                "question": RunnablePassthrough(),
-            }
-            | prompt
-            | llm
-        )
         with st.chat_message("ai"):
-            chain.invoke(message)
+            chain.invoke(
+                {"question": message, "retriever": retriever},
+                {"callbacks": [ChatCallbackHandler()]},
+            )
 
 
 else:
+    corpus.sync([])
     st.session_state["messages"] = []
\ No newline at end of file
@@ -1,98 +1,34 @@
-import json
+import os
 import streamlit as st
-from langchain.retrievers import WikipediaRetriever
 from langchain.chat_models import ChatOpenAI
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.prompts import ChatPromptTemplate
-from langchain.callbacks import StreamingStdOutCallbackHandler
 from langchain.schema import BaseOutputParser
+from utils.quiz import (
+    QUIZ_MODEL,
+    build_questions_chain,
+    build_questions_prompt,
+    make_quiz,
+    split_path,
+)
+from utils.quiz_store import open_quiz_store, quiz_key
+from utils.registry import get_chain, get_model, get_resource
+from utils.wiki_store import WikipediaSource, open_wiki_store
 
 
 st.set_page_config(page_title="QuizGPT", page_icon="❓")
 
 
-def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
-
-# The reason for using double bracket, is to not letting langchain to get confused.
-# It's helpful to add output format '''json
-# This will not let LLM to reply as such: "Certainly! I would like to answer that!"
-function = {
-    "name": "create_quiz",
-    "description": "function that takes a list of questions and answers and returns a quiz",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "questions": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "question": {
-                            "type": "string",
-                        },
-                        "answers": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "answer": {
-                                        "type": "string",
-                                    },
-                                    "correct": {
-                                        "type": "boolean",
-                                    },
-                                },
-                                "required": ["answer", "correct"],
-                            },
-                        },
-                    },
-                    "required": ["question", "answers"],
-                },
-            }
-        },
-        "required": ["questions"],
-    },
-}
-
-
-llm = ChatOpenAI(
-    temperature=0.1,
-    model="gpt-3.5-turbo-1106",
-    streaming=True,
-    callbacks=[
-        StreamingStdOutCallbackHandler(),
-    ],
-).bind(
-    function_call={
-        "name": "create_quiz",
-    },
-    functions=[
-        function,
-    ],
-)
-
-
-questions_prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            """
-    You are a helpful assistant that is role playing as a teacher.
-            
-    Based ONLY on the following context make 10 (TEN) questions minimum to test the user's knowledge about the text.
+# one per process, shared by every session (utils/registry.py)
+llm = get_model(ChatOpenAI, streaming=True, **QUIZ_MODEL)
 
-    Each question should have 4 answers, three of them must be incorrect and one should be correct.
+questions_prompt = get_resource("quiz_questions_prompt", build_questions_prompt)
 
-    Context: {context}
-    """,
-        )
-    ]
+questions_chain = get_chain(
+    "quiz_questions", build_questions_chain, llm=llm, prompt=questions_prompt
 )
 
-
-questions_chain = {"context": format_docs} | questions_prompt | llm
+# quizzes are looked up by content (utils/quiz_store.py), so they survive
+# restarts and an edited file with the same name gets a new one
+quiz_store = open_quiz_store()
 
 
 @st.cache_data(show_spinner="Loading file...")
@@ -101,25 +37,29 @@ def split_file(file):
     file_path = f"./.cache/quiz_files/{file.name}"
     with open(file_path, "wb") as f:
         f.write(file_content)
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
+    return split_path(file_path)
+
+
+def render_question(idx, question):
+    st.write(question["question"])
+    value = st.radio(f"Select an option {idx}", [answer["answer"] for answer in question["answers"]],
+        index=None,
     )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    return docs
+    if {"answer": value, "correct": True} in question["answers"]:
+        st.success("Correct!")
+    elif value is not None:
+        st.error("Wrong!")
+
+
+# Articles come from the local store (utils/wiki_store.py) and only new
+# topics go to the live API, never with QUIZ_WIKI_OFFLINE=1.
+wikipedia = get_resource(
+    "wikipedia_source",
+    WikipediaSource,
+    store=open_wiki_store(),
+    offline=os.getenv("QUIZ_WIKI_OFFLINE") == "1",
+)
 
-# caching the document that already uploaded.
-# The reason for caching is to save time when re-run the same documents.
-# @st.cache_data(show_spinner="Making quiz...")
-# The reason why it should be _docs is that if we just say docs, 
-# docs parameter is not hashable 
-@st.cache_data(show_spinner="Making quiz...")
-def run_quiz_chain(_docs, topic):
-    response = questions_chain.invoke(_docs)
-    response = response.additional_kwargs["function_call"]["arguments"]
-    return json.loads(response)
 
 # caching the wikipedia search
 # cache data hash the parameter "term".
@@ -128,8 +68,7 @@ def run_quiz_chain(_docs, topic):
 # So it gives the previous values.
 @st.cache_data(show_spinner="Searching Wikipedia...")
 def wiki_search(term):
-    retriever = WikipediaRetriever(top_k_results=1)
-    docs = retriever.get_relevant_documents(term)
+    docs = wikipedia.get_relevant_documents(term)
     return docs
 
 
@@ -158,6 +97,7 @@ with st.sidebar:
         topic = st.text_input("Search Wikipedia...")
         if topic:
             docs = wiki_search(topic)
+    count = st.slider("Number of questions", 5, 30, 10)
 
 if not docs:
     st.markdown(
@@ -170,17 +110,27 @@ if not docs:
     """
     )
 else:
-    response = run_quiz_chain(docs, topic if topic else file.name)
+    # a finished quiz is stored once and looked up on every rerun after
+    # (answering one reruns the page), by any session
+    if topic:
+        content = "\n\n".join(doc.page_content for doc in docs)
+    else:
+        content = file.getvalue()
+    key = quiz_key(content, count)
     with st.form("questions_form"):
-        for idx, question in enumerate(response["questions"]):
-            st.write(question["question"])
-            value = st.radio(f"Select an option {idx}", [answer["answer"] for answer in question["answers"]],
-                index=None,
-            )
-            if {"answer": value, "correct": True} in question["answers"]:
-                st.success("Correct!")
-            elif value is not None:
-                st.error("Wrong!")
+        quiz = quiz_store.get(key)
+        if quiz is None:
+            # each question is drawn as soon as it has streamed in; the radios
+            # can be answered already, the form only reruns on submit
+            quiz = []
+            status = st.empty()
+            status.caption("Making quiz...")
+            for question in make_quiz(questions_chain, docs, count):
+                render_question(len(quiz), question)
+                quiz.append(question)
+            status.empty()
+            quiz_store.put(key, quiz, source=topic if topic else file.name)
+        else:
+            for idx, question in enumerate(quiz):
+                render_question(idx, question)
         button = st.form_submit_button()
-        
-    
\ No newline at end of file
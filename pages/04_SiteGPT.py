@@ -1,18 +1,23 @@
-from langchain.document_loaders import SitemapLoader
+import os
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
+from utils.crawler import crawl_sitemap
+from utils.faiss_store import documents_key, load_or_build
+from utils.fanout import NoResults, batch_with_timeout
+from utils.registry import get_chain, get_model, get_resource
+from utils.semantic_cache import answer_scope, open_answer_cache
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 import streamlit as st
 
-llm = ChatOpenAI(
-    temperature=0.1,
-)
+# one per process, shared by every session (utils/registry.py)
+llm = get_model(ChatOpenAI, temperature=0.1)
 
-answers_prompt = ChatPromptTemplate.from_template(
-    """
+answers_prompt = get_resource(
+    "site_answers_prompt",
+    ChatPromptTemplate.from_template,
+    template="""
     Using ONLY the following context answer the user's question. If you can't just say you don't know, don't make anything up.
                                                   
     Then, give a score to the answer between 0 and 5.
@@ -36,11 +41,18 @@ answers_prompt = ChatPromptTemplate.from_template(
     Your turn!
 
     Question: {question}
-"""
+""",
 )
 
 
-def get_answers(inputs):
+# the answers for all retrieved pages are asked for at once (utils/fanout.py),
+# a page whose answer fails or takes longer than SITE_ANSWER_TIMEOUT is logged
+# and left out, and with no answers at all there is nothing to choose from
+ANSWER_CONCURRENCY = int(os.getenv("SITE_ANSWER_CONCURRENCY", "8"))
+ANSWER_TIMEOUT = float(os.getenv("SITE_ANSWER_TIMEOUT", "30"))
+
+
+def get_answers(inputs, config):
     docs = inputs["docs"]
     question = inputs["question"]
     answers_chain = answers_prompt | llm
@@ -50,23 +62,39 @@ def get_answers(inputs):
     #         {"question": question, "context": doc.page_content}
     #     )
     #     answers.append(result.content)
-    return {
-        "question": question,
-        "answers": [
+    results = batch_with_timeout(
+        answers_chain,
+        [{"question": question, "context": doc.page_content} for doc in docs],
+        config,
+        max_concurrency=ANSWER_CONCURRENCY,
+        timeout=ANSWER_TIMEOUT,
+    )
+    answers = []
+    for doc, result in zip(docs, results):
+        if isinstance(result, BaseException):
+            source = doc.metadata["source"]
+            print(f"SiteGPT: no answer from {source}: {type(result).__name__}: {result}")
+            continue
+        answers.append(
             {
-                "answer": answers_chain.invoke(
-                    {"question": question, "context": doc.page_content}
-                ).content,
+                "answer": result.content,
                 "source": doc.metadata["source"],
                 "date": doc.metadata["lastmod"],
             }
-            for doc in docs
-        ],
-    }
-
-
-choose_prompt = ChatPromptTemplate.from_messages(
-    [
+        )
+    if not docs:
+        raise NoResults("I couldn't find any page on this site about that.")
+    if not answers:
+        raise NoResults(
+            f"None of the {len(docs)} pages I found could be read in time, please ask again."
+        )
+    return {"question": question, "answers": answers}
+
+
+choose_prompt = get_resource(
+    "site_choose_prompt",
+    ChatPromptTemplate.from_messages,
+    messages=[
         (
             "system",
             """
@@ -80,7 +108,7 @@ choose_prompt = ChatPromptTemplate.from_messages(
             """,
         ),
         ("human", "{question}"),
-    ]
+    ],
 )
 
 
@@ -100,6 +128,28 @@ def choose_answer(inputs):
     )
 
 
+def retrieve(inputs, config):
+    return inputs["retriever"].invoke(inputs["question"], config)
+
+
+def build_chain():
+    return (
+        RunnablePassthrough.assign(docs=RunnableLambda(retrieve))
+        | RunnableLambda(get_answers)
+        | RunnableLambda(choose_answer)
+    )
+
+
+chain = get_chain("site_qa", build_chain)
+
+# Every question costs one call per retrieved page plus one to pick the
+# answer, so paraphrases of an earlier question about the same site content
+# reuse its answer (utils/semantic_cache.py).
+answer_cache = open_answer_cache(
+    "./.cache/answers.db", get_resource("openai_embeddings", OpenAIEmbeddings)
+)
+
+
 def parse_page(soup):
     header = soup.find("header")
     footer = soup.find("footer")
@@ -115,20 +165,25 @@ def parse_page(soup):
     )
 
 
-@st.cache_data(show_spinner="Loading website...")
+# pages are fetched as fast as the host allows (utils/crawler.py), an unchanged
+# site reuses the index saved for the same documents (utils/faiss_store.py)
+@st.cache_resource(show_spinner="Loading website...")
 def load_website(url):
     splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=1000,
         chunk_overlap=200,
     )
-    loader = SitemapLoader(
+    pages, _ = crawl_sitemap(
         url,
         parsing_function=parse_page,
+        concurrency=int(os.getenv("SITE_CRAWL_CONCURRENCY", "16")),
+        max_rate=float(os.getenv("SITE_CRAWL_MAX_RATE", "64")),
     )
-    loader.requests_per_second = 2
-    docs = loader.load_and_split(text_splitter=splitter)
-    vector_store = FAISS.from_documents(docs, OpenAIEmbeddings())
-    return vector_store.as_retriever()
+    docs = splitter.split_documents(pages)
+    embeddings = OpenAIEmbeddings()
+    key = documents_key(docs, embeddings)
+    vector_store = load_or_build(key, embeddings, lambda: docs)
+    return vector_store.as_retriever(), key
 
 
 st.set_page_config(
@@ -160,16 +215,21 @@ if url:
         with st.sidebar:
             st.error("Please write down a Sitemap URL.")
     else:
-        retriever = load_website(url)
+        retriever, corpus = load_website(url)
         query = st.text_input("Ask a question to the website.")
         if query:
-            chain = (
-                {
-                    "docs": retriever,
-                    "question": RunnablePassthrough(),
-                }
-                | RunnableLambda(get_answers)
-                | RunnableLambda(choose_answer)
-            )
-            result = chain.invoke(query)
-            st.markdown(result.content.replace("$", "\$"))
\ No newline at end of file
+            scope = answer_scope(corpus, [answers_prompt, choose_prompt], llm)
+            answer, vector = answer_cache.get(scope, query)
+            if answer is None:
+                try:
+                    answer = chain.invoke({"question": query, "retriever": retriever}).content
+                    answer_cache.put(scope, query, answer, vector)
+                except NoResults as e:
+                    # not cached, asking again may well work
+                    answer = str(e)
+            st.markdown(answer.replace("$", "\$"))
+            with st.sidebar:
+                st.caption(
+                    f"Answered {answer_cache.stats['hits']} of {answer_cache.stats['lookups']} "
+                    f"questions from the answer cache ({answer_cache.hit_rate:.0%})."
+                )
\ No newline at end of file
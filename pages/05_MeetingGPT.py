@@ -1,4 +1,3 @@
-from langchain.storage import LocalFileStore
 import streamlit as st
 import subprocess
 import math
@@ -11,33 +10,46 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import StrOutputParser
-from langchain.vectorstores.faiss import FAISS
-from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
+from utils.faiss_store import corpus_key, load_or_build
+from langchain.embeddings import OpenAIEmbeddings
+from utils.embedding_cache import MAX_BYTES, ContentAddressedEmbeddings
+from utils.registry import get_model, get_resource
+from utils.sqlite_store import open_store
 
-llm = ChatOpenAI(
-    temperature=0.1,
-)
+llm = get_model(ChatOpenAI, temperature=0.1)
 
 has_transcript = os.path.exists("./.cache/podcast.txt")
 
-splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+splitter = get_resource(
+    "meeting_splitter",
+    RecursiveCharacterTextSplitter.from_tiktoken_encoder,
     chunk_size=800,
     chunk_overlap=100,
 )
 
 
-@st.cache_data()
+# The FAISS index is saved by transcript content (utils/faiss_store.py), so it
+# survives restarts and is shared between sessions.
+@st.cache_resource()
 def embed_file(file_path):
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
+    with open(file_path, "rb") as f:
+        file_content = f.read()
+    cache_dir = open_store("./.cache/embeddings.db", max_bytes=MAX_BYTES)
     splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=800,
         chunk_overlap=100,
     )
-    loader = TextLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
     embeddings = OpenAIEmbeddings()
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
+    cached_embeddings = ContentAddressedEmbeddings(embeddings, cache_dir)
+
+    def load_docs():
+        loader = TextLoader(file_path)
+        return loader.load_and_split(text_splitter=splitter)
+
+    key = corpus_key(
+        file_content, "RecursiveCharacterTextSplitter", 800, 100, embeddings.model
+    )
+    vectorstore = load_or_build(key, cached_embeddings, load_docs)
     retriever = vectorstore.as_retriever()
     return retriever
 
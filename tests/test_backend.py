@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import time
+
+import pytest
+
+from chef.backend import BackendNotReady, SearchBackend
+from chef.embeddings import HashingEmbeddings
+from chef.local_index import build_index, load_index
+
+RECIPES = [
+    ("Kimchi Fried Rice", "kimchi, rice, egg", "Fry the rice with the kimchi."),
+    ("Mapo Tofu", "tofu, chili bean paste", "Simmer the tofu in the sauce."),
+    ("Garlic Noodles", "noodles, garlic, butter", "Toss the noodles in garlic butter."),
+]
+
+
+@pytest.fixture
+def recipe_index(tmp_path):
+    csv_path = tmp_path / "recipes.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, ["href", "title", "ingredients", "preparation"])
+        writer.writeheader()
+        for i, (title, ingredients, preparation) in enumerate(RECIPES):
+            writer.writerow(
+                {
+                    "href": f"https://example.com/{i}",
+                    "title": title,
+                    "ingredients": ingredients,
+                    "preparation": preparation,
+                }
+            )
+    out = tmp_path / "recipe_index"
+    build_index(str(csv_path), str(out), HashingEmbeddings())
+    return load_index(str(out))
+
+
+def test_local_index_finds_recipe_offline(recipe_index):
+    docs = recipe_index.similarity_search("Mapo Tofu\n\ntofu, chili bean paste", k=1)
+    assert docs[0].metadata["title"] == "Mapo Tofu"
+    assert len(recipe_index) == len(RECIPES)
+
+
+def test_wait_ready_returns_backend_once_initialized(recipe_index):
+    backend = SearchBackend(lambda: (recipe_index, None))
+
+    async def main():
+        ready = await backend.wait_ready(timeout=5)
+        vector = await ready.query_embedder.embed("garlic noodles")
+        return ready, vector
+
+    ready, vector = asyncio.run(main())
+    assert ready is backend
+    assert backend.ready and backend.error is None
+    assert backend.status()["attempts"] == 1
+    assert len(vector) == len(recipe_index.vectors[0])
+
+
+def test_wait_ready_times_out_while_starting_then_succeeds(recipe_index):
+    def slow_factory():
+        time.sleep(0.3)
+        return recipe_index, None
+
+    backend = SearchBackend(slow_factory)
+
+    async def main():
+        with pytest.raises(BackendNotReady, match="still starting"):
+            await backend.wait_ready(timeout=0.01)
+        # the timeout doesn't cancel the initialization
+        return await backend.wait_ready(timeout=5)
+
+    assert asyncio.run(main()) is backend
+    assert backend.attempts == 1
+
+
+def test_failing_factory_is_reported_and_retried(recipe_index):
+    calls = []
+
+    def flaky_factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("pinecone unreachable")
+        return recipe_index, None
+
+    backend = SearchBackend(flaky_factory, retry_delay=0.2)
+
+    async def main():
+        with pytest.raises(BackendNotReady):
+            await backend.wait_ready(timeout=0.1)
+        # once it has failed, requests don't wait for the retry
+        start = time.perf_counter()
+        with pytest.raises(BackendNotReady, match="pinecone unreachable"):
+            await backend.wait_ready(timeout=5)
+        assert time.perf_counter() - start < 0.1
+        await backend.start()
+        return await backend.wait_ready(timeout=0)
+
+    assert asyncio.run(main()) is backend
+    assert backend.attempts == 2
+    assert backend.error is None
@@ -0,0 +1,56 @@
+import pytest
+from langchain.embeddings import OllamaEmbeddings
+
+from benchmarks.fakes import FakeOllamaServer
+from utils.parallel_embeddings import ParallelEmbeddings
+
+TEXTS = [f"chunk {i} about {word}" for i, word in enumerate("abcdefghijklmnopqrstuvw")]
+
+
+def expected(server, texts, instruction="passage: "):
+    return [server.embeddings.embed_query(instruction + text) for text in texts]
+
+
+def test_vectors_come_back_in_text_order():
+    # batches finish in whatever order the server gets to them
+    with FakeOllamaServer(latency=0.01, capacity=4) as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        embeddings = ParallelEmbeddings(ollama, workers=4, batch_size=3)
+        vectors = embeddings.embed_documents(TEXTS)
+        assert vectors == expected(server, TEXTS)
+        assert server.requests == len(TEXTS)
+    assert embeddings.stats["batches"] == 8
+    assert embeddings.stats["texts"] == len(TEXTS)
+
+
+def test_failed_batches_are_retried():
+    with FakeOllamaServer(latency=0.0, capacity=4, failure_rate=0.2, seed=1) as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        embeddings = ParallelEmbeddings(ollama, workers=4, batch_size=2, retries=10, backoff=0.001)
+        vectors = embeddings.embed_documents(TEXTS)
+        assert vectors == expected(server, TEXTS)
+        assert server.failures > 0
+    assert embeddings.stats["retries"] > 0
+
+
+def test_gives_up_after_retries():
+    with FakeOllamaServer(latency=0.0, failure_rate=1.0) as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        embeddings = ParallelEmbeddings(ollama, workers=2, batch_size=4, retries=2, backoff=0.001)
+        with pytest.raises(ValueError, match="503"):
+            embeddings.embed_documents(TEXTS[:8])
+    assert embeddings.stats["retries"] >= 2
+
+
+def test_embed_query_uses_the_query_instruction():
+    with FakeOllamaServer(latency=0.0) as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        vector = ParallelEmbeddings(ollama).embed_query("kimchi")
+        assert vector == expected(server, ["kimchi"], "query: ")[0]
+
+
+def test_empty_input_makes_no_requests():
+    with FakeOllamaServer() as server:
+        ollama = OllamaEmbeddings(model="llama2:latest", base_url=server.url)
+        assert ParallelEmbeddings(ollama).embed_documents([]) == []
+        assert server.requests == 0
@@ -0,0 +1,76 @@
+import pytest
+from langchain.schema import Document
+
+from utils.wiki_store import DOC_CONTENT_CHARS_MAX, WikiArticleStore, WikipediaSource
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = WikiArticleStore(str(tmp_path / "wikipedia.db"))
+    store.import_articles(
+        [
+            ("World War II", "The Second World War was a global conflict.", "https://w/WWII"),
+            ("World War I", "The First World War began in 1914.", "https://w/WWI"),
+            ("Kimchi", "Kimchi is a Korean side dish.", "https://w/Kimchi"),
+        ]
+    )
+    yield store
+    store.close()
+
+
+def article(title, text="text"):
+    return Document(page_content=text, metadata={"title": title, "summary": None, "source": title})
+
+
+def test_find_exact_title(store):
+    docs = store.find("kimchi")
+    assert [doc.metadata["title"] for doc in docs] == ["Kimchi"]
+    assert docs[0].metadata["source"] == "https://w/Kimchi"
+
+
+def test_find_title_words_with_prefix(store):
+    titles = {doc.metadata["title"] for doc in store.find("world wa", limit=5)}
+    assert titles == {"World War II", "World War I"}
+
+
+def test_find_unknown_term(store):
+    assert store.find("quantum chromodynamics") == []
+    assert store.find("!!!") == []
+
+
+def test_term_leads_to_the_article_it_found(store):
+    store.put(article("Second World War", "Also known as WWII."), term="ww2")
+    assert store.find("WW2")[0].metadata["title"] == "Second World War"
+
+
+def test_put_replaces_the_article(store):
+    store.put(article("Kimchi", "Updated."))
+    assert store.find("kimchi")[0].page_content == "Updated."
+    assert len(store) == 3
+
+
+def test_offline_source_never_fetches(store):
+    def fetch(term):
+        raise AssertionError("went to the network")
+
+    source = WikipediaSource(store, fetch=fetch, offline=True)
+    assert source.get_relevant_documents("kimchi")[0].metadata["title"] == "Kimchi"
+    assert source.get_relevant_documents("photosynthesis") == []
+    assert source.stats == {"lookups": 2, "hits": 1, "fetches": 0}
+
+
+def test_online_source_saves_what_it_fetches(store):
+    fetched = []
+
+    def fetch(term):
+        fetched.append(term)
+        return [article("Photosynthesis", "x" * (DOC_CONTENT_CHARS_MAX + 10))]
+
+    source = WikipediaSource(store, fetch=fetch)
+    first = source.get_relevant_documents("photosynthesis")
+    second = source.get_relevant_documents("photosynthesis")
+    assert fetched == ["photosynthesis"]
+    assert len(first[0].page_content) == DOC_CONTENT_CHARS_MAX
+    assert second[0].page_content == first[0].page_content
+    # the whole article is kept, only what's handed out is cut
+    assert len(store.find("photosynthesis")[0].page_content) == DOC_CONTENT_CHARS_MAX + 10
@@ -0,0 +1,102 @@
+# Conversation summarization off the answer's critical path.
+#
+# ConversationSummaryBufferMemory.save_context prunes right away, and when the
+# buffer is over max_token_limit that means a blocking summarization call to
+# memory_llm before the next answer can start. BackgroundSummaryMemory wraps
+# it so that save_context only appends the turn and the pruning + summary run
+# on a worker thread after the answer has streamed. load_memory_variables
+# always returns immediately with the latest finished summary plus the raw
+# turns that haven't been summarized yet.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.callbacks import get_openai_callback
+
+
+class BackgroundSummaryMemory:
+    def __init__(self, memory):
+        self.memory = memory
+        self.lock = threading.Lock()
+        # one worker, so summaries are applied in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.stats = {
+            "summaries": 0,
+            "summary_seconds": 0.0,
+            "summary_tokens": 0,
+            "summary_cost": 0.0,
+            "load_seconds": 0.0,
+            "loads": 0,
+        }
+
+    @property
+    def memory_key(self):
+        return self.memory.memory_key
+
+    @property
+    def chat_memory(self):
+        return self.memory.chat_memory
+
+    @property
+    def moving_summary_buffer(self):
+        return self.memory.moving_summary_buffer
+
+    @moving_summary_buffer.setter
+    def moving_summary_buffer(self, summary):
+        with self.lock:
+            self.memory.moving_summary_buffer = summary
+
+    def load_memory_variables(self, inputs):
+        start = time.perf_counter()
+        with self.lock:
+            variables = self.memory.load_memory_variables(inputs)
+            variables[self.memory_key] = list(variables[self.memory_key])
+        self.stats["load_seconds"] += time.perf_counter() - start
+        self.stats["loads"] += 1
+        return variables
+
+    def save_context(self, inputs, outputs):
+        input_str, output_str = self.memory._get_input_output(inputs, outputs)
+        with self.lock:
+            self.memory.chat_memory.add_user_message(input_str)
+            self.memory.chat_memory.add_ai_message(output_str)
+        self.pending = self.executor.submit(self._prune)
+
+    def wait(self, timeout=None):
+        """Block until the queued summaries are done, for tests and shutdown."""
+        if self.pending is not None:
+            self.pending.result(timeout)
+
+    def _prune(self):
+        memory = self.memory
+        with self.lock:
+            buffer = list(memory.chat_memory.messages)
+            summary = memory.moving_summary_buffer
+        length = memory.llm.get_num_tokens_from_messages(buffer)
+        if length <= memory.max_token_limit:
+            return
+        pruned = 0
+        while length > memory.max_token_limit and pruned < len(buffer):
+            pruned += 1
+            length = memory.llm.get_num_tokens_from_messages(buffer[pruned:])
+
+        start = time.perf_counter()
+        with get_openai_callback() as callback:
+            new_summary = memory.predict_new_summary(buffer[:pruned], summary)
+        self.stats["summaries"] += 1
+        self.stats["summary_seconds"] += time.perf_counter() - start
+        self.stats["summary_tokens"] += callback.total_tokens
+        self.stats["summary_cost"] += callback.total_cost
+
+        with self.lock:
+            # only this thread removes from the front, so these are still the
+            # messages we summarized; new turns were appended at the end
+            del memory.chat_memory.messages[:pruned]
+            memory.moving_summary_buffer = new_summary
+
+    def clear(self):
+        self.wait()
+        with self.lock:
+            self.memory.clear()
@@ -0,0 +1,96 @@
+# Append-only, per-session chat memory log.
+#
+# Each chat session gets its own folder, so two users never overwrite each
+# other, and a turn only appends to it instead of rewriting the whole memory:
+#
+#   journal.jsonl   one line per message, appended after each turn
+#   snapshot.json   the memory (summary + recent messages) every few turns,
+#                   after which the journal starts over
+#
+# Loading reads the snapshot plus whatever was journaled after it, once per
+# session.
+
+import json
+import os
+import re
+
+from langchain.schema import messages_from_dict, messages_to_dict
+
+DEFAULT_JOURNAL_ROOT = "./.cache/chat_memory"
+SESSION_ID_RE = re.compile(r"^[a-f0-9]{32}$")
+
+
+class ChatJournal:
+    def __init__(self, session_id, root=DEFAULT_JOURNAL_ROOT, snapshot_every=10):
+        if not SESSION_ID_RE.match(session_id):
+            raise ValueError(f"Invalid chat session id: {session_id}")
+        self.folder = os.path.join(root, session_id)
+        self.journal_path = os.path.join(self.folder, "journal.jsonl")
+        self.snapshot_path = os.path.join(self.folder, "snapshot.json")
+        self.snapshot_every = snapshot_every
+        self.turns_since_snapshot = 0
+        # messages written so far, lets load() skip journal lines that a
+        # snapshot already covers if we crashed before truncating the journal
+        self.sequence = 0
+        self._loaded = False
+
+    def exists(self):
+        return os.path.exists(self.journal_path) or os.path.exists(self.snapshot_path)
+
+    def load(self):
+        """Returns (summary, messages) as of the last turn written."""
+        summary, messages = "", []
+        self.sequence = 0
+        self.turns_since_snapshot = 0
+        self._loaded = True
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            summary = snapshot["summary"]
+            messages = messages_from_dict(snapshot["messages"])
+            self.sequence = snapshot["sequence"]
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # half written line from a crash
+                    entry = json.loads(line)
+                    if entry["sequence"] < self.sequence:
+                        continue
+                    messages.extend(messages_from_dict([entry["message"]]))
+                    self.sequence = entry["sequence"] + 1
+                    self.turns_since_snapshot += 1
+        self.turns_since_snapshot //= 2
+        return summary, messages
+
+    def append_turn(self, input_message, output_message, memory=None):
+        """Write one human/ai exchange; snapshot the memory every few turns."""
+        if not self._loaded:
+            # continue the numbering even if the old chat wasn't restored
+            self.load()
+        os.makedirs(self.folder, exist_ok=True)
+        lines = []
+        for message in messages_to_dict([input_message, output_message]):
+            lines.append(json.dumps({"sequence": self.sequence, "message": message}))
+            self.sequence += 1
+        with open(self.journal_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+        self.turns_since_snapshot += 1
+        if memory is not None and self.turns_since_snapshot >= self.snapshot_every:
+            self.snapshot(memory)
+
+    def snapshot(self, memory):
+        os.makedirs(self.folder, exist_ok=True)
+        # messages before summary: if a background summary lands in between
+        # we keep a few messages twice instead of losing them
+        messages = messages_to_dict(list(memory.chat_memory.messages))
+        summary = memory.moving_summary_buffer
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"sequence": self.sequence, "summary": summary, "messages": messages},
+                f,
+            )
+        os.replace(tmp_path, self.snapshot_path)
+        open(self.journal_path, "w").close()
+        self.turns_since_snapshot = 0
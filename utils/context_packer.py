@@ -0,0 +1,160 @@
+# Build the {context} string for the retrieval prompts.
+#
+# The splitters overlap neighbouring chunks (100 tokens, 200 in SiteGPT), so
+# joining the retrieved chunks as they come puts the overlapping text into the
+# prompt twice whenever two neighbours are returned. pack_context:
+#
+#   - drops chunks that are already in the context,
+#   - strips the text a chunk shares with a neighbour that's already in,
+#   - takes chunks in the order given (relevance, for a retriever) until
+#     max_tokens is used up,
+#   - and glues neighbours back together so they read as one passage.
+#
+# Token counts come from a tiktoken encoding loaded once per process, and
+# counts per chunk are cached since the same chunks come back all the time.
+
+import functools
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+# shorter shared text than this is more likely a coincidence than an overlap
+MIN_OVERLAP_CHARS = 20
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name=DEFAULT_ENCODING):
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # no network to download the encoding (PrivateGPT is meant to run
+        # offline), count_tokens falls back to an estimate
+        return None
+
+
+@functools.lru_cache(maxsize=16384)
+def count_tokens(text, encoding_name=DEFAULT_ENCODING):
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        # ~4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, encoding_name=DEFAULT_ENCODING):
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def find_overlap(first, second, min_chars=MIN_OVERLAP_CHARS):
+    """Length of the longest end of first that second starts with."""
+    if len(first) < min_chars or len(second) < min_chars:
+        return 0
+    head = second[:min_chars]
+    start = max(0, len(first) - len(second))
+    position = first.find(head, start)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(head, position + 1)
+    return 0
+
+
+class _Passage:
+    def __init__(self, source, text):
+        self.source = source
+        self.text = text
+        self.next = None
+        self.previous = None
+
+
+def pack_context(
+    docs,
+    max_tokens=None,
+    separator="\n\n",
+    encoding_name=DEFAULT_ENCODING,
+    stats=None,
+):
+    """Join docs into one context string, without repeated text and within
+    max_tokens (None means no limit)."""
+    separator_tokens = count_tokens(separator, encoding_name)
+    passages = []
+    seen = set()
+    used = 0
+    for doc in docs:
+        source = doc.metadata.get("source")
+        text = doc.page_content.strip()
+        if not text or (source, text) in seen:
+            continue
+        seen.add((source, text))
+
+        # link to neighbours already in the context and keep only the new text
+        previous = next_ = None
+        start, end = 0, len(text)
+        for passage in passages:
+            if passage.source != source:
+                continue
+            if previous is None and passage.next is None:
+                overlap = find_overlap(passage.text, text)
+                if overlap:
+                    previous, start = passage, overlap
+                    continue
+            if next_ is None and passage.previous is None:
+                overlap = find_overlap(text, passage.text)
+                if overlap:
+                    next_, end = passage, len(text) - overlap
+        if start >= end:
+            # all of it is already in the context
+            continue
+        new_text = text[start:end]
+
+        cost = count_tokens(new_text, encoding_name)
+        if previous is None and next_ is None:
+            cost += separator_tokens
+        if max_tokens is not None and used + cost > max_tokens:
+            if passages:
+                continue  # a shorter chunk further down might still fit
+            new_text = truncate_to_tokens(new_text, max_tokens, encoding_name)
+            cost = max_tokens
+
+        if next_ is not None and previous is not None and _head(previous) is next_:
+            next_ = None  # would close a loop
+        passage = _Passage(source, new_text)
+        if previous is not None:
+            previous.next, passage.previous = passage, previous
+        if next_ is not None:
+            next_.previous, passage.next = passage, next_
+        passages.append(passage)
+        used += cost
+
+    # passages are in relevance order, each run of neighbours is printed
+    # where its most relevant chunk came
+    blocks = []
+    printed = set()
+    for passage in passages:
+        head = _head(passage)
+        if id(head) in printed:
+            continue
+        printed.add(id(head))
+        parts = []
+        node = head
+        while node is not None:
+            parts.append(node.text)
+            node = node.next
+        blocks.append("".join(parts))
+
+    if stats is not None:
+        stats["chunks"] = stats.get("chunks", 0) + len(docs)
+        stats["packed_chunks"] = stats.get("packed_chunks", 0) + len(passages)
+        stats["passages"] = stats.get("passages", 0) + len(blocks)
+        stats["tokens"] = stats.get("tokens", 0) + used
+    return separator.join(blocks)
+
+
+def _head(passage):
+    while passage.previous is not None:
+        passage = passage.previous
+    return passage
+
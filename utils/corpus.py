@@ -0,0 +1,112 @@
+# Many files, one searchable corpus.
+#
+# Each file keeps its own FAISS index (a shard), built and saved by content
+# hash (utils/faiss_store.py), so adding a file only embeds that file and
+# removing one just forgets its shard. A query is embedded once and searched in every
+# shard in parallel (FAISS releases the GIL while it searches), and the best
+# k hits across shards are merged by distance. The search threads are one
+# pool per process (utils/registry.py), shared by every session's corpus.
+#
+# A shard is anything with similarity_search_with_score_by_vector(vector, k)
+# that returns (document, distance) pairs: a FAISS store or an IngestJob
+# that's still indexing.
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+
+from utils.faiss_store import corpus_key
+from utils.registry import get_resource
+
+
+class ShardedCorpus:
+    def __init__(self, embeddings, max_workers=8):
+        self.embeddings = embeddings
+        self.shards = {}
+        self.names = {}
+        self.lock = threading.Lock()
+        self.max_workers = max_workers
+        self.executor = get_resource(
+            "corpus_search_executor", ThreadPoolExecutor, max_workers=max_workers
+        )
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __contains__(self, key):
+        return key in self.shards
+
+    @property
+    def key(self):
+        """Hash of the files in the corpus, changes whenever one is added or removed."""
+        with self.lock:
+            return corpus_key(*sorted(self.shards))
+
+    def add(self, key, shard, name=None):
+        with self.lock:
+            self.shards[key] = shard
+            self.names[key] = name or key
+
+    def remove(self, key):
+        with self.lock:
+            self.shards.pop(key, None)
+            self.names.pop(key, None)
+
+    def sync(self, keys):
+        """Drop every shard whose key isn't in keys, returns the dropped keys."""
+        keys = set(keys)
+        with self.lock:
+            removed = [key for key in self.shards if key not in keys]
+        for key in removed:
+            self.remove(key)
+        return removed
+
+    def search_with_score(self, query, k=4):
+        with self.lock:
+            shards = list(self.shards.values())
+        if not shards:
+            return []
+        embedding = self.embeddings.embed_query(query)
+
+        def search_group(group):
+            hits = [
+                hit
+                for shard in group
+                for hit in shard.similarity_search_with_score_by_vector(embedding, k)
+            ]
+            # smaller distance is closer
+            return heapq.nsmallest(k, hits, key=lambda hit: hit[1])
+
+        # one task per worker rather than per shard, with thousands of small
+        # files the thread hand-offs would cost more than the searches
+        workers = min(self.max_workers, len(shards))
+        groups = [shards[i::workers] for i in range(workers)]
+        if workers == 1:
+            results = [search_group(shards)]
+        else:
+            results = self.executor.map(search_group, groups)
+        return heapq.nsmallest(
+            k, (hit for hits in results for hit in hits), key=lambda hit: hit[1]
+        )
+
+    def search(self, query, k=4):
+        return [doc for doc, _ in self.search_with_score(query, k)]
+
+    def as_retriever(self, k=4):
+        return CorpusRetriever(corpus=self, k=k)
+
+
+class CorpusRetriever(BaseRetriever):
+    """Top k chunks across every file in the corpus."""
+
+    corpus: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.corpus.search(query, self.k)
@@ -0,0 +1,336 @@
+# Sitemap crawler for SiteGPT.
+#
+# SitemapLoader reads the whole sitemap first, then fetches at most
+# requests_per_second pages at a time, each on a new connection, and only
+# parses them once every page is in. This crawler:
+#
+#   - keeps one pool of keep-alive connections for the whole crawl
+#   - paces every host with its own token bucket that speeds up while the
+#     host keeps answering and halves its rate on a 429 or 503 (honouring
+#     Retry-After)
+#   - reads robots.txt first, skips disallowed pages and never goes faster
+#     than its crawl-delay / request-rate
+#   - parses the sitemap while it downloads, so pages are fetched while the
+#     rest of the sitemap is still coming in, and parses every page as soon
+#     as it arrives
+#
+# Documents look like SitemapLoader's: the page text run through
+# parsing_function(soup), metadata {"source": loc, "loc", "lastmod", ...}.
+
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from urllib import robotparser
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+
+USER_AGENT = "SiteGPT"
+# worth another try after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# the host asking us to slow down
+THROTTLE_STATUSES = {429, 503}
+SITEMAP_FIELDS = ("loc", "lastmod", "changefreq", "priority")
+
+
+def _default_parsing_function(soup):
+    return str(soup.get_text())
+
+
+def _host(url):
+    parsed = urlparse(url)
+    return parsed.scheme, parsed.netloc
+
+
+def _tag(element):
+    # "{http://www.sitemaps.org/schemas/sitemap/0.9}url" -> "url"
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class TokenBucket:
+    """Requests per second for one host, adapting to how the host copes.
+
+    Like TCP: until the host first pushes back every success raises the rate
+    by 10% (slow start), after that by `increase`; a throttled response
+    halves it. Always between min_rate and max_rate.
+    """
+
+    def __init__(self, rate, max_rate, min_rate=0.5, increase=0.5, burst=1):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.slow_start = True
+
+    def limit(self, max_rate):
+        """Never go above max_rate (robots.txt crawl-delay)."""
+        self.max_rate = min(self.max_rate, max_rate)
+        self.min_rate = min(self.min_rate, self.max_rate)
+        self.rate = min(self.rate, self.max_rate)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def success(self):
+        self._refill(time.monotonic())
+        if self.slow_start:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self, retry_after=None):
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.slow_start = False
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class SitemapCrawler:
+    def __init__(
+        self,
+        sitemap_url,
+        parsing_function=None,
+        concurrency=16,
+        rate=8.0,
+        max_rate=64.0,
+        timeout=30,
+        retries=3,
+        restrict_to_same_domain=True,
+        user_agent=USER_AGENT,
+    ):
+        self.sitemap_url = sitemap_url
+        self.parsing_function = parsing_function or _default_parsing_function
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_rate = max_rate
+        self.timeout = timeout
+        self.retries = retries
+        self.restrict_to_same_domain = restrict_to_same_domain
+        self.user_agent = user_agent
+        self.buckets = {}
+        self._robots = {}
+        self.stats = {
+            "pages": 0,
+            "failed": 0,
+            "disallowed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "seconds": 0.0,
+        }
+
+    def bucket(self, url):
+        host = _host(url)
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.max_rate)
+        return self.buckets[host]
+
+    async def _get(self, session, url):
+        """The response for url, paced by the host's bucket and retried on
+        throttling, server errors and dropped connections. The caller reads
+        and releases it."""
+        bucket = self.bucket(url)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            await bucket.acquire()
+            try:
+                response = await session.get(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last:
+                    raise
+                self.stats["retries"] += 1
+                bucket.throttled()
+                continue
+            if response.status in RETRY_STATUSES and not last:
+                response.release()
+                self.stats["retries"] += 1
+                if response.status in THROTTLE_STATUSES:
+                    self.stats["throttled"] += 1
+                bucket.throttled(_retry_after(response))
+                continue
+            if response.status < 400:
+                bucket.success()
+            response.raise_for_status()
+            return response
+
+    async def _load_robots(self, session, url):
+        scheme, netloc = _host(url)
+        parser = robotparser.RobotFileParser()
+        try:
+            response = await self._get(session, f"{scheme}://{netloc}/robots.txt")
+            async with response:
+                parser.parse((await response.text()).splitlines())
+        except aiohttp.ClientResponseError as e:
+            # what RobotFileParser.read() does with error statuses
+            if e.status in (401, 403):
+                parser.disallow_all = True
+            else:
+                parser.allow_all = True
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            parser.allow_all = True
+        delay = parser.crawl_delay(self.user_agent)
+        if delay:
+            self.bucket(url).limit(1 / float(delay))
+        request_rate = parser.request_rate(self.user_agent)
+        if request_rate:
+            self.bucket(url).limit(request_rate.requests / request_rate.seconds)
+        return parser
+
+    async def _allowed(self, session, url):
+        host = _host(url)
+        if host not in self._robots:
+            # one robots.txt request per host, however many pages wait on it
+            self._robots[host] = asyncio.ensure_future(self._load_robots(session, url))
+        robots = await self._robots[host]
+        return robots.can_fetch(self.user_agent, url)
+
+    async def _sitemap_entries(self, session, url):
+        """Entries of a sitemap (and of the sitemaps it lists), each one as
+        soon as its closing tag has been downloaded."""
+        parser = ET.XMLPullParser(events=("end",))
+        children = []
+        response = await self._get(session, url)
+        async with response:
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    name = _tag(element)
+                    if name not in ("url", "sitemap"):
+                        continue
+                    fields = {_tag(child): (child.text or "").strip() for child in element}
+                    element.clear()
+                    if not fields.get("loc"):
+                        continue
+                    if name == "sitemap":
+                        children.append(fields["loc"])
+                    else:
+                        yield {key: fields[key] for key in SITEMAP_FIELDS if key in fields}
+        parser.close()
+        for child in children:
+            async for entry in self._sitemap_entries(session, child):
+                yield entry
+
+    def _parse(self, html):
+        return self.parsing_function(BeautifulSoup(html, "html.parser"))
+
+    async def _fetch_page(self, session, entry):
+        response = await self._get(session, entry["loc"])
+        async with response:
+            # a page with the wrong charset is still mostly readable
+            html = await response.text(errors="replace")
+        loop = asyncio.get_running_loop()
+        # parse off the event loop, the other downloads carry on meanwhile
+        text = await loop.run_in_executor(None, self._parse, html)
+        return Document(page_content=text, metadata={"source": entry["loc"], **entry})
+
+    async def crawl(self):
+        """Yield (position in the sitemap, Document) for every page, in the
+        order they finish."""
+        start = time.perf_counter()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": self.user_agent},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as session:
+            entries = asyncio.Queue(maxsize=self.concurrency * 4)
+            results = asyncio.Queue()
+
+            async def produce():
+                try:
+                    position = 0
+                    async for entry in self._sitemap_entries(session, self.sitemap_url):
+                        if self.restrict_to_same_domain and _host(entry["loc"]) != _host(
+                            self.sitemap_url
+                        ):
+                            continue
+                        await entries.put((position, entry))
+                        position += 1
+                finally:
+                    for _ in range(self.concurrency):
+                        await entries.put(None)
+
+            async def work():
+                while (item := await entries.get()) is not None:
+                    position, entry = item
+                    try:
+                        if not await self._allowed(session, entry["loc"]):
+                            self.stats["disallowed"] += 1
+                            continue
+                        document = await self._fetch_page(session, entry)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        # a network error, or a page parsing_function can't
+                        # handle: skip it, the rest of the site carries on
+                        self.stats["failed"] += 1
+                        continue
+                    self.stats["pages"] += 1
+                    await results.put((position, document))
+
+            async def run():
+                # the sitemap's own host: its robots.txt limits the bucket
+                # before the first page goes out
+                await self._allowed(session, self.sitemap_url)
+                producer = asyncio.ensure_future(produce())
+                try:
+                    await asyncio.gather(*[work() for _ in range(self.concurrency)])
+                    await producer
+                finally:
+                    producer.cancel()
+                    await results.put(None)
+
+            runner = asyncio.ensure_future(run())
+            try:
+                while (item := await results.get()) is not None:
+                    yield item
+                await runner
+            finally:
+                runner.cancel()
+        self.stats["seconds"] += time.perf_counter() - start
+
+
+def crawl_sitemap(sitemap_url, **kwargs):
+    """All pages of a sitemap, in sitemap order (so the same site gives the
+    same documents_key), and the crawler for its stats."""
+    crawler = SitemapCrawler(sitemap_url, **kwargs)
+
+    async def collect():
+        return [item async for item in crawler.crawl()]
+
+    pages = asyncio.run(collect())
+    return [document for _, document in sorted(pages, key=lambda item: item[0])], crawler
@@ -0,0 +1,84 @@
+# Content-addressed embedding cache shared by every upload.
+#
+# Vectors are kept in the SQLite store (utils/sqlite_store.py) under the
+# embedding model and the hash of the chunk's text, never the file name, so
+# each unique chunk is embedded once no matter which file, session or user it
+# came from. Past EMBEDDING_CACHE_MAX_MB the least recently used vectors are
+# evicted.
+
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+# what the pages open their cache stores with
+MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+def model_namespace(embeddings):
+    name = getattr(embeddings, "model", None) or type(embeddings).__name__
+    return re.sub(r"[^a-zA-Z0-9_.\-]", "_", name)
+
+
+def chunk_key(namespace, text):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # the format every cached vector is stored under, changing it would
+    # orphan them all
+    return f"{namespace}/{digest[:2]}/{digest}"
+
+
+def encode_vector(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_vector(data):
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class ContentAddressedEmbeddings(Embeddings):
+    """Drop-in for CacheBackedEmbeddings that also counts cache hits."""
+
+    def __init__(self, underlying_embeddings, store, namespace=None):
+        self.underlying_embeddings = underlying_embeddings
+        self.store = store
+        self.namespace = namespace or model_namespace(underlying_embeddings)
+        self.stats = {"chunks": 0, "hits": 0, "embedded": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        return self.stats["hits"] / self.stats["chunks"] if self.stats["chunks"] else 0.0
+
+    def embed_documents(self, texts):
+        keys = [chunk_key(self.namespace, text) for text in texts]
+        cached = self.store.mget(keys)
+        vectors = [None if data is None else decode_vector(data) for data in cached]
+
+        # a chunk repeated inside the same upload is only embedded once too
+        missing = {}
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = [texts[missing[key][0]] for key in missing_keys]
+            embedded = self.underlying_embeddings.embed_documents(missing_texts)
+            self.store.mset(
+                [(key, encode_vector(vector)) for key, vector in zip(missing_keys, embedded)]
+            )
+            for key, vector in zip(missing_keys, embedded):
+                for i in missing[key]:
+                    vectors[i] = list(vector)
+
+        with self._stats_lock:
+            self.stats["chunks"] += len(texts)
+            self.stats["embedded"] += len(missing)
+            self.stats["hits"] += len(texts) - len(missing)
+        return vectors
+
+    def embed_query(self, text):
+        return self.underlying_embeddings.embed_query(text)
@@ -0,0 +1,143 @@
+# Persistent FAISS indexes shared between sessions and server processes.
+#
+# Indexes are saved under ./.cache/faiss/<corpus hash>/ and loaded from there,
+# so a restart (or another server process) doesn't build them again:
+#
+#   index.faiss   the FAISS index. Empty for flat indexes, whose vectors are
+#                 in vectors.npy: faiss reads an IndexFlat into memory even
+#                 with IO_FLAG_MMAP (only IVF lists get mapped)
+#   index.pkl     the docstore, same format as FAISS.save_local
+#   vectors.npy   memory-mapped, so processes share the OS page cache: all
+#                 the vectors of a flat index, searched in place
+#                 (quantized_index.MappedFlatIndex), or the exact vectors of
+#                 a compressed one, read only for re-ranking
+#
+# Use it from st.cache_resource, not st.cache_data: cache_data pickles the
+# return value, which would copy the mapped vectors into every session.
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import faiss
+from langchain.vectorstores.faiss import FAISS
+
+from utils.embedding_cache import model_namespace
+from utils.quantized_index import (
+    ReRankingFAISS,
+    convert_vectorstore,
+    is_flat,
+    load_exact_vectors,
+    load_flat,
+    save_flat,
+    set_search_params,
+)
+
+DEFAULT_INDEX_ROOT = "./.cache/faiss"
+
+
+def corpus_key(*parts):
+    """Hash anything that decides the index contents (file bytes, splitter
+    settings, model) into a directory name."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()[:32]
+
+
+def documents_key(docs, embeddings):
+    return corpus_key(
+        model_namespace(embeddings),
+        *[(doc.page_content, doc.metadata) for doc in docs],
+    )
+
+
+def index_exists(path):
+    return os.path.exists(os.path.join(path, "index.faiss")) and os.path.exists(
+        os.path.join(path, "index.pkl")
+    )
+
+
+def read_index(path):
+    index_path = os.path.join(path, "index.faiss")
+    try:
+        return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(index_path)
+
+
+def load_vectorstore(path, embeddings, rerank=None, nprobe=None, ef_search=None):
+    index = set_search_params(read_index(path), nprobe, ef_search)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    exact_vectors = load_exact_vectors(path)
+    mapped = load_flat(index, exact_vectors)
+    if mapped is not None:
+        return FAISS(embeddings, mapped, docstore, index_to_docstore_id)
+    if exact_vectors is not None:
+        return ReRankingFAISS(
+            embeddings,
+            index,
+            docstore,
+            index_to_docstore_id,
+            exact_vectors=exact_vectors,
+            rerank=rerank,
+        )
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def save_vectorstore(vectorstore, path):
+    """Write next to path and rename, so readers never see half an index.
+    If another process got there first, its copy is kept."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    if is_flat(vectorstore.index):
+        save_flat(vectorstore, tmp_path)
+    else:
+        vectorstore.save_local(tmp_path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def index_path(key, root=DEFAULT_INDEX_ROOT):
+    os.makedirs(root, exist_ok=True)
+    return os.path.join(root, key)
+
+
+def load_or_build(
+    key,
+    embeddings,
+    load_docs,
+    root=DEFAULT_INDEX_ROOT,
+    index_type="auto",
+    **search_params,
+):
+    """Return the FAISS store saved under key, building it from load_docs() once.
+
+    load_docs is only called on a miss, so an upload that was indexed before
+    isn't even parsed again. index_type is one of quantized_index.INDEX_TYPES;
+    "auto" is flat up to FLAT_MAX_VECTORS and ivf above, hnsw is only built
+    when asked for. search_params (rerank, nprobe, ef_search) only apply to
+    the index types that use them.
+    """
+    if index_type != "flat":
+        key = f"{key}-{index_type}"
+    path = index_path(key, root)
+    if not index_exists(path):
+        vectorstore = FAISS.from_documents(load_docs(), embeddings)
+        save_vectorstore(convert_vectorstore(vectorstore, index_type), path)
+    return load_vectorstore(path, embeddings, **search_params)
+
+
+def load_or_build_from_documents(docs, embeddings, root=DEFAULT_INDEX_ROOT):
+    """Same, keyed on the documents themselves, for corpora (like websites)
+    that have to be fetched anyway to know what's in them."""
+    return load_or_build(documents_key(docs, embeddings), embeddings, lambda: docs, root)
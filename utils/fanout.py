@@ -0,0 +1,40 @@
+# One LLM call per input, all at once, for map steps like SiteGPT's answer
+# per retrieved page.
+#
+# Runnable.abatch already runs the calls concurrently with a
+# max_concurrency, but one call that hangs holds up the whole batch, and with
+# return_exceptions=False one that fails throws the other answers away. Here
+# every call gets its own timeout, and a call that failed or timed out comes
+# back as its exception, so the caller can carry on with the rest.
+
+import asyncio
+
+
+class NoResults(Exception):
+    """Nothing in a batch came back, for the caller to tell the user."""
+
+
+async def _call(runnable, input, config, semaphore, timeout):
+    async with semaphore:
+        # the timeout starts once the call does, not while it waits its turn
+        return await asyncio.wait_for(runnable.ainvoke(input, config), timeout)
+
+
+async def abatch_with_timeout(runnable, inputs, config=None, max_concurrency=8, timeout=None):
+    """runnable.ainvoke on every input, max_concurrency at a time and each
+    given at most timeout seconds. Results are in input order."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(
+        *[_call(runnable, input, config, semaphore, timeout) for input in inputs],
+        return_exceptions=True,
+    )
+
+
+def batch_with_timeout(runnable, inputs, config=None, max_concurrency=8, timeout=None):
+    """abatch_with_timeout from synchronous code (a Streamlit script or a
+    RunnableLambda), on an event loop of its own."""
+    if not inputs:
+        return []
+    return asyncio.run(
+        abatch_with_timeout(runnable, inputs, config, max_concurrency, timeout)
+    )
@@ -0,0 +1,242 @@
+# Streaming, parallel ingestion for large uploads.
+#
+# stream_to_disk first copies the upload to disk in 1 MB pieces while it's
+# hashed. An IngestJob then indexes the file in a background thread, each
+# stage working on what the previous one has finished so far, so a 500-page
+# PDF shows progress (and answers) long before it's done. Its STAGES, the
+# ones job.progress counts:
+#
+#   parse    PDFs are cut into groups of pages and parsed in a process pool
+#   split    each parsed group is split as soon as it's ready, in page order
+#   embed    chunks are embedded in batches on a few threads, with a bound on
+#            how many batches are in flight
+#
+# Every embedded batch is added to the FAISS store right away.
+# The retriever from job.as_retriever() searches whatever has been indexed so
+# far, so questions about the first pages work while the rest is still going.
+
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, List
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+from langchain.vectorstores.faiss import FAISS
+
+STAGES = ("parse", "split", "embed")
+
+
+def stream_to_disk(file, folder, chunk_size=1 << 20):
+    """Copy an upload to folder piece by piece, returning (path, sha256 hex)."""
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    file.seek(0)
+    with open(tmp_path, "wb") as f:
+        while True:
+            piece = file.read(chunk_size)
+            if not piece:
+                break
+            digest.update(piece)
+            f.write(piece)
+    file_hash = digest.hexdigest()
+    path = os.path.join(folder, f"{file_hash[:16]}_{os.path.basename(file.name)}")
+    os.replace(tmp_path, path)
+    return path, file_hash
+
+
+def plan_units(file_path, pages_per_unit=10):
+    """Cut a file into pieces that can be parsed independently."""
+    if file_path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        pages = len(PdfReader(file_path).pages)
+        return [
+            (file_path, start, min(start + pages_per_unit, pages))
+            for start in range(0, pages, pages_per_unit)
+        ] or [(file_path, None, None)]
+    return [(file_path, None, None)]
+
+
+def parse_unit(unit):
+    """Runs in a worker process, so it only takes and returns picklable things."""
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    file_path, start, end = unit
+    if start is None:
+        return UnstructuredFileLoader(file_path).load()
+
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for page in reader.pages[start:end]:
+        writer.add_page(page)
+    part_path = f"{file_path}.{start}-{end}.{os.getpid()}.pdf"
+    with open(part_path, "wb") as f:
+        writer.write(f)
+    try:
+        docs = UnstructuredFileLoader(part_path).load()
+    finally:
+        os.remove(part_path)
+    for doc in docs:
+        doc.metadata["source"] = file_path
+        doc.metadata["pages"] = f"{start + 1}-{end}"
+    return docs
+
+
+class IngestJob:
+    def __init__(
+        self,
+        file_path,
+        splitter,
+        embeddings,
+        parse=parse_unit,
+        pages_per_unit=10,
+        parse_workers=None,
+        embed_workers=4,
+        batch_size=32,
+        on_complete=None,
+    ):
+        self.file_path = file_path
+        self.splitter = splitter
+        self.embeddings = embeddings
+        self.parse = parse
+        self.pages_per_unit = pages_per_unit
+        self.parse_workers = parse_workers or max(1, min(4, os.cpu_count() or 1))
+        self.embed_workers = embed_workers
+        self.batch_size = batch_size
+        self.on_complete = on_complete
+        self.vectorstore = None
+        self.error = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.progress = {stage: [0, 0] for stage in STAGES}
+        self.timings = {}
+        self._started = None
+        self._thread = None
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, embeddings):
+        """A job that's already finished, for indexes loaded from disk."""
+        job = cls(None, None, embeddings)
+        job.vectorstore = vectorstore
+        job.done.set()
+        return job
+
+    @property
+    def ready(self):
+        """True once at least one batch can be searched."""
+        return self.vectorstore is not None
+
+    def start(self):
+        if self._thread is None and not self.done.is_set():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.vectorstore
+
+    def _advance(self, stage, done=0, total=0):
+        with self.lock:
+            self.progress[stage][0] += done
+            self.progress[stage][1] += total
+
+    def _run(self):
+        self._started = time.perf_counter()
+        try:
+            self._pipeline()
+            self.timings["total_seconds"] = time.perf_counter() - self._started
+            if self.on_complete is not None and self.vectorstore is not None:
+                self.on_complete(self.vectorstore)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def _pipeline(self):
+        units = plan_units(self.file_path, self.pages_per_unit)
+        self._advance("parse", total=len(units))
+        with ThreadPoolExecutor(self.embed_workers) as embedders:
+            in_flight = set()
+            for docs in self._parsed(units):
+                self._advance("parse", done=1)
+                chunks = self.splitter.split_documents(docs)
+                self._advance("split", done=len(chunks), total=len(chunks))
+                self._advance("embed", total=len(chunks))
+                for i in range(0, len(chunks), self.batch_size):
+                    while len(in_flight) >= self.embed_workers * 2:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            future.result()
+                    batch = chunks[i : i + self.batch_size]
+                    in_flight.add(embedders.submit(self._embed_and_index, batch))
+            for future in in_flight:
+                future.result()
+
+    def _parsed(self, units):
+        # starting worker processes costs about a second, not worth it for one piece
+        if len(units) == 1:
+            yield self.parse(units[0])
+            return
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.parse_workers, mp_context=context) as parsers:
+            parsed = [parsers.submit(self.parse, unit) for unit in units]
+            # consume in page order, so the beginning of the file is indexed first
+            for future in parsed:
+                yield future.result()
+
+    def _embed_and_index(self, batch):
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+        text_embeddings = [(doc.page_content, v) for doc, v in zip(batch, vectors)]
+        metadatas = [doc.metadata for doc in batch]
+        with self.lock:
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(
+                    text_embeddings, self.embeddings, metadatas=metadatas
+                )
+                self.timings["first_batch_seconds"] = time.perf_counter() - self._started
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+        self._advance("embed", done=len(batch))
+
+    def search(self, query, k=4):
+        embedding = self.embeddings.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        # same signature as FAISS, so a job can be a shard of a ShardedCorpus
+        if self.vectorstore is None:
+            return []
+        with self.lock:
+            return self.vectorstore.similarity_search_with_score_by_vector(embedding, k)
+
+    def as_retriever(self, k=4):
+        return IngestRetriever(job=self, k=k)
+
+
+class IngestRetriever(BaseRetriever):
+    """Retriever over whatever part of the job has been indexed so far."""
+
+    job: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.job.search(query, self.k)
+
@@ -0,0 +1,58 @@
+# Objects out of a JSON document that is still being streamed.
+#
+# A forced function call streams its arguments a few characters at a time,
+# {"questions": [{...}, {...}, ...]}, and json.loads can only run once the
+# last "]}" is in. ObjectStreamParser watches the brackets as the text comes
+# in (skipping the ones inside strings) and hands back every object that
+# closes at the given nesting depth, parsed, as soon as its "}" arrives. The
+# rest of the document is never parsed, so each character is looked at once.
+
+import json
+
+
+class ObjectStreamParser:
+    """feed() text pieces, get back the objects that finished in them.
+
+    depth counts the brackets around the objects: 2 for the items of
+    {"questions": [...]}.
+    """
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        # text of the object being read, once one has started
+        self._current = []
+
+    def feed(self, text):
+        found = []
+        start = 0 if self._current else None
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and len(self._stack) == self.depth:
+                    start = i
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    raise ValueError(f"Unexpected {char!r} in JSON stream")
+                self._stack.pop()
+                if char == "}" and len(self._stack) == self.depth:
+                    self._current.append(text[start : i + 1])
+                    found.append(json.loads("".join(self._current)))
+                    self._current = []
+                    start = None
+        if start is not None:
+            self._current.append(text[start:])
+        return found
+
@@ -0,0 +1,85 @@
+# Embed batches of chunks on several threads at once.
+#
+# OllamaEmbeddings sends one HTTP request per chunk, one after the other, so
+# indexing a file in PrivateGPT waited on every request in turn while the
+# Ollama server (which can work on several at once) sat mostly idle.
+# ParallelEmbeddings splits the texts into batches, embeds up to `workers`
+# batches at the same time, retries a failed batch with exponential backoff
+# and puts the vectors back in the order of the texts, so it can be handed to
+# FAISS.from_documents (or ContentAddressedEmbeddings) like any Embeddings.
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.embeddings.base import Embeddings
+
+
+class ParallelEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying_embeddings,
+        workers=4,
+        batch_size=8,
+        retries=3,
+        backoff=0.5,
+        max_backoff=8.0,
+    ):
+        self.underlying_embeddings = underlying_embeddings
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {"batches": 0, "texts": 0, "retries": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model(self):
+        # ContentAddressedEmbeddings and the index keys go by the model name
+        return getattr(self.underlying_embeddings, "model", None)
+
+    def _with_retries(self, embed, arg):
+        attempt = 0
+        while True:
+            try:
+                return embed(arg)
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2**attempt)
+                # jitter, so the workers don't all come back at the same moment
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+
+    def _embed_batch(self, batch):
+        return self._with_retries(self.underlying_embeddings.embed_documents, batch)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        start = time.perf_counter()
+        batches = [
+            texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1 or self.workers <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as executor:
+                # map yields in submission order, whichever batch finishes first
+                results = list(executor.map(self._embed_batch, batches))
+        vectors = [vector for batch in results for vector in batch]
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        with self._stats_lock:
+            self.stats["batches"] += len(batches)
+            self.stats["texts"] += len(texts)
+            self.stats["seconds"] += time.perf_counter() - start
+        return vectors
+
+    def embed_query(self, text):
+        return self._with_retries(self.underlying_embeddings.embed_query, text)
@@ -0,0 +1,277 @@
+# FAISS index types other than the flat one LangChain builds.
+#
+# Faster search for big corpora. A flat index compares the query with every
+# vector, fine for a chapter but linear in the corpus:
+#
+#   ivf   IndexIVFFlat: vectors bucketed around 2 sqrt(n) centroids, a query
+#         only scans the nprobe closest buckets (1/16 of them by default)
+#   hnsw  IndexHNSWFlat: a navigable graph walked with efSearch candidates
+#   auto  flat up to FLAT_MAX_VECTORS vectors, ivf above (see
+#         choose_index_type); hnsw is only used when asked for by name
+#
+# Smaller indexes for big local embeddings.
+#
+# llama2 embeddings are 4096 float32s, 16 KB a chunk, and the flat index keeps
+# every one of them in RAM. Two compressed options:
+#
+#   sq8   each dimension stored as one byte (IndexScalarQuantizer), 4x smaller
+#   pq    product quantization (IndexPQ), one byte per 8 dimensions, 32x
+#         smaller; each subquantizer's 256 centroids need ~39 training
+#         points apiece (~10k vectors), smaller corpora get sq8
+#
+# Both only approximate the distances, so by default the top `rerank` x k
+# candidates (4 x k for sq8, 10 x k for the coarser pq) are re-scored
+# exactly against the full vectors. Those are kept in vectors.npy next to the
+# index and memory-mapped: only the rows of the candidates are ever read, the
+# rest stays on disk.
+
+import os
+
+import faiss
+import numpy as np
+from langchain.vectorstores.faiss import FAISS
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq8", "pq", "auto")
+# 8 bit pq trains 256 centroids per subquantizer, k-means wants 39 points
+# each; with 2k vectors faiss warns per subquantizer and recall was 0.59
+PQ_MIN_VECTORS = 39 * 256
+# auto: exact search up to this many vectors, ivf above. From
+# benchmarks/index_types.py (128 dims, one core): flat takes 7 ms a query at
+# 100k and 77 ms at 1M; ivf 0.4 ms / 6 ms with the same top 10. hnsw answers
+# faster still but took 4x longer to build (280 s at 1M) and more memory, so
+# it's only used when asked for.
+FLAT_MAX_VECTORS = 50000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+
+def choose_index_type(count):
+    return "flat" if count <= FLAT_MAX_VECTORS else "ivf"
+
+
+def ivf_lists(count):
+    # ~2 sqrt(n) buckets, and at least 39 training points per bucket
+    return max(1, min(int(2 * count**0.5), count // 39))
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """How hard ivf / hnsw search; higher finds more true neighbours, slower."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe or max(1, index.nlist // 16)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+def pq_subquantizers(dim):
+    """Largest divisor of dim that gives sub-vectors of at least 8 dims."""
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_index(vectors, index_type):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if index_type == "auto":
+        index_type = choose_index_type(count)
+    if index_type == "pq" and count < PQ_MIN_VECTORS:
+        index_type = "sq8"
+    if index_type == "ivf" and ivf_lists(count) < 2:
+        index_type = "flat"
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, ivf_lists(count), faiss.METRIC_L2)
+        # train the centroids on a sample, k-means over millions of vectors
+        # would take longer than embedding them
+        index.cp.max_points_per_centroid = 64
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_L2)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif index_type == "pq":
+        index = faiss.IndexPQ(dim, pq_subquantizers(dim), 8, faiss.METRIC_L2)
+    elif index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return set_search_params(index)
+
+
+def flat_vectors(index):
+    if isinstance(index, MappedFlatIndex):
+        return index.vectors
+    return index.reconstruct_n(0, index.ntotal)
+
+
+class MappedFlatIndex:
+    """Exact L2 search over a memory-mapped vectors.npy, with the parts of
+    faiss.IndexFlatL2 the FAISS store uses (search, reconstruct, ntotal).
+
+    faiss ignores IO_FLAG_MMAP for IndexFlat and reads every vector into the
+    process, so flat indexes are saved as vectors.npy instead (save_flat) and
+    scanned here a block of rows at a time, like chef/local_index.py.
+
+    add, merge_from and remove_ids (what FAISS.add_texts, merge_from and
+    delete call) work on an in-memory copy of the vectors, made the first
+    time the store is changed; the file on disk is never written.
+    """
+
+    is_trained = True
+    metric_type = faiss.METRIC_L2
+
+    def __init__(self, vectors, block_rows=16384):
+        self.vectors = vectors
+        self.ntotal, self.d = vectors.shape
+        self.block_rows = block_rows
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        if not self.ntotal:
+            return distances, labels
+        # one float per vector and query, the vectors themselves stay mapped
+        all_distances = np.empty((len(queries), self.ntotal), dtype=np.float32)
+        query_norms = (queries * queries).sum(axis=1)[:, None]
+        for start in range(0, self.ntotal, self.block_rows):
+            block = np.asarray(self.vectors[start : start + self.block_rows], dtype=np.float32)
+            all_distances[:, start : start + len(block)] = (
+                (block * block).sum(axis=1)[None, :] - 2 * queries @ block.T + query_norms
+            )
+        np.maximum(all_distances, 0, out=all_distances)
+        found = min(k, self.ntotal)
+        top = np.argpartition(all_distances, found - 1, axis=1)[:, :found]
+        top_distances = np.take_along_axis(all_distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        labels[:, :found] = np.take_along_axis(top, order, axis=1)
+        distances[:, :found] = np.take_along_axis(top_distances, order, axis=1)
+        return distances, labels
+
+    def reconstruct(self, i):
+        return np.array(self.vectors[i], dtype=np.float32)
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.ntotal = len(self.vectors)
+
+    def merge_from(self, other, add_id=0):
+        self.add(flat_vectors(other))
+
+    def remove_ids(self, ids):
+        keep = np.ones(self.ntotal, dtype=bool)
+        keep[np.asarray(ids, dtype=np.int64)] = False
+        self.vectors = np.asarray(self.vectors)[keep]
+        self.ntotal = len(self.vectors)
+        return int((~keep).sum())
+
+    def reconstruct_n(self, start, n):
+        return np.array(self.vectors[start : start + n], dtype=np.float32)
+
+
+def is_flat(index):
+    return isinstance(index, MappedFlatIndex) or (
+        isinstance(index, faiss.IndexFlat) and index.metric_type == faiss.METRIC_L2
+    )
+
+
+def save_flat(vectorstore, folder_path):
+    """Save a flat store as vectors.npy, with an empty IndexFlatL2 of the same
+    dimension as index.faiss; load_flat maps it back."""
+    index = vectorstore.index
+    FAISS(
+        vectorstore.embedding_function,
+        faiss.IndexFlatL2(index.d),
+        vectorstore.docstore,
+        vectorstore.index_to_docstore_id,
+    ).save_local(folder_path)
+    np.save(
+        os.path.join(folder_path, "vectors.npy"),
+        np.asarray(flat_vectors(index), dtype=np.float32),
+    )
+
+
+def load_flat(index, exact_vectors):
+    """The MappedFlatIndex for a store saved by save_flat, None for any other."""
+    if exact_vectors is None or not isinstance(index, faiss.IndexFlat) or index.ntotal:
+        return None
+    return MappedFlatIndex(exact_vectors)
+
+
+class ReRankingFAISS(FAISS):
+    """FAISS over a compressed index that re-scores the best candidates
+    with the exact vectors."""
+
+    def __init__(self, *args, exact_vectors=None, rerank=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact_vectors = exact_vectors
+        if rerank is None:
+            rerank = 10 if isinstance(self.index, faiss.IndexPQ) else 4
+        self.rerank = rerank
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k=4, filter=None, fetch_k=20, **kwargs
+    ):
+        if self.exact_vectors is None or not self.rerank or filter is not None or kwargs:
+            return super().similarity_search_with_score_by_vector(
+                embedding, k, filter=filter, fetch_k=fetch_k, **kwargs
+            )
+        vector = np.array([embedding], dtype=np.float32)
+        _, indices = self.index.search(vector, k * self.rerank)
+        ids = [int(i) for i in indices[0] if i != -1]
+        if not ids:
+            return []
+        # sorted reads are kinder to the page cache
+        order = np.argsort(ids)
+        rows = np.asarray(self.exact_vectors[np.asarray(ids)[order]], dtype=np.float32)
+        distances = np.empty(len(ids), dtype=np.float32)
+        distances[order] = ((rows - vector) ** 2).sum(axis=1)
+        best = np.argsort(distances)[:k]
+        return [
+            (self.docstore.search(self.index_to_docstore_id[ids[j]]), float(distances[j]))
+            for j in best
+        ]
+
+    def save_local(self, folder_path, index_name="index"):
+        super().save_local(folder_path, index_name)
+        if self.exact_vectors is not None:
+            np.save(os.path.join(folder_path, "vectors.npy"), np.asarray(self.exact_vectors))
+
+
+def convert_vectorstore(vectorstore, index_type, rerank=None):
+    """Same documents, another index. Compressed ones keep the exact vectors
+    for re-ranking."""
+    if index_type == "flat":
+        return vectorstore
+    vectors = flat_vectors(vectorstore.index)
+    index = build_index(vectors, index_type)
+    if isinstance(index, faiss.IndexFlat):
+        return vectorstore
+    if not isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexPQ)):
+        return FAISS(
+            vectorstore.embedding_function,
+            index,
+            vectorstore.docstore,
+            vectorstore.index_to_docstore_id,
+        )
+    return ReRankingFAISS(
+        vectorstore.embedding_function,
+        index,
+        vectorstore.docstore,
+        vectorstore.index_to_docstore_id,
+        exact_vectors=vectors,
+        rerank=rerank,
+    )
+
+
+def load_exact_vectors(path):
+    vectors_path = os.path.join(path, "vectors.npy")
+    if not os.path.exists(vectors_path):
+        return None
+    return np.load(vectors_path, mmap_mode="r")
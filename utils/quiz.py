@@ -0,0 +1,243 @@
+# Quiz generation over a whole file, a few chunks at a time.
+#
+# The chunks are packed into groups that fit a token budget, so big files
+# never overflow the context window. Questions are generated for every group
+# at the same time, near-identical ones are dropped, and every question is
+# handed back as soon as its JSON object has streamed in
+# (utils/json_stream.py), so the page can show it while the rest are still
+# being written.
+#
+# The prompt, function and splitter live here too, so the quiz store's batch
+# pre-generation (utils/quiz_store.py) writes exactly the quizzes the page
+# would.
+
+import math
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.document_loaders import UnstructuredFileLoader
+from langchain.prompts import ChatPromptTemplate
+from langchain.text_splitter import CharacterTextSplitter
+
+from utils.context_packer import count_tokens, pack_context
+from utils.json_stream import ObjectStreamParser
+
+QUIZ_MODEL = {"model": "gpt-3.5-turbo-1106", "temperature": 0.1}
+SPLITTER = {"separator": "\n", "chunk_size": 600, "chunk_overlap": 100}
+# chunks per question-writing call, and how many calls run at once
+QUIZ_GROUP_TOKENS = 3000
+QUIZ_WORKERS = 4
+
+# questions sharing this much of their words are the same question
+DUPLICATE_SIMILARITY = 0.7
+
+
+def group_chunks(docs, max_tokens):
+    """Consecutive chunks, split into groups of at most max_tokens each."""
+    groups, group, used = [], [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if group and used + tokens > max_tokens:
+            groups.append(group)
+            group, used = [], 0
+        group.append(doc)
+        used += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def question_words(question):
+    return set(re.findall(r"[a-z0-9]+", question["question"].lower()))
+
+
+def is_duplicate(words, seen):
+    for other in seen:
+        union = words | other
+        if union and len(words & other) / len(union) >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def generate_quiz(groups, generate, count, workers=4):
+    """Yield new questions as they are written, count in total.
+
+    generate(group, count) yields the questions for one group, each one as
+    soon as it's complete. Every group gets an equal share first, so the quiz
+    covers the whole file; the extra questions fill up whatever is left once
+    all groups are done. With more groups than questions, count groups spread
+    evenly over the file are asked instead of the first ones. A group whose
+    call fails is skipped; only when every group fails is the error raised.
+    """
+    if not groups or count < 1:
+        return
+    if len(groups) > count:
+        groups = [groups[i * len(groups) // count] for i in range(count)]
+    share = math.ceil(count / len(groups))
+    seen = []
+    leftovers = []
+    taken = [0] * len(groups)
+    accepted = 0
+    errors = []
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def work(index, group):
+        try:
+            # a couple more than the share, some will turn out to be duplicates
+            for question in generate(group, share + 2):
+                if stop.is_set():
+                    break
+                results.put((index, question))
+        except Exception as e:
+            results.put((index, e))
+        finally:
+            results.put((index, None))
+
+    def is_new(question):
+        words = question_words(question)
+        if is_duplicate(words, seen):
+            return False
+        seen.append(words)
+        return True
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(groups)))
+    try:
+        for index, group in enumerate(groups):
+            executor.submit(work, index, group)
+        running = len(groups)
+        while running:
+            index, question = results.get()
+            if question is None:
+                running -= 1
+            elif isinstance(question, Exception):
+                errors.append(question)
+            elif taken[index] >= share:
+                leftovers.append(question)
+            elif is_new(question):
+                taken[index] += 1
+                accepted += 1
+                yield question
+                if accepted >= count:
+                    return
+    finally:
+        # enough questions (or the page went away): stop the calls
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if len(errors) == len(groups):
+        raise errors[0]
+    for question in leftovers:
+        if accepted >= count:
+            break
+        if is_new(question):
+            accepted += 1
+            yield question
+
+
+# The whole group goes into the prompt. pack_context sends the 100 token
+# overlap between neighbouring chunks once and stops at a budget that leaves
+# room in the 16k context.
+def format_docs(docs):
+    return pack_context(docs, max_tokens=12000)
+
+
+# The reason for using double bracket, is to not letting langchain to get confused.
+# It's helpful to add output format '''json
+# This will not let LLM to reply as such: "Certainly! I would like to answer that!"
+QUIZ_FUNCTION = {
+    "name": "create_quiz",
+    "description": "function that takes a list of questions and answers and returns a quiz",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question": {
+                            "type": "string",
+                        },
+                        "answers": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "answer": {
+                                        "type": "string",
+                                    },
+                                    "correct": {
+                                        "type": "boolean",
+                                    },
+                                },
+                                "required": ["answer", "correct"],
+                            },
+                        },
+                    },
+                    "required": ["question", "answers"],
+                },
+            }
+        },
+        "required": ["questions"],
+    },
+}
+
+QUESTIONS_PROMPT = """
+    You are a helpful assistant that is role playing as a teacher.
+            
+    Based ONLY on the following context make {count} questions minimum to test the user's knowledge about the text.
+
+    Each question should have 4 answers, three of them must be incorrect and one should be correct.
+
+    Context: {context}
+    """
+
+
+def build_questions_prompt():
+    return ChatPromptTemplate.from_messages([("system", QUESTIONS_PROMPT)])
+
+
+def build_questions_chain(llm, prompt):
+    return (
+        {
+            "context": lambda inputs: format_docs(inputs["docs"]),
+            "count": lambda inputs: inputs["count"],
+        }
+        | prompt
+        | llm.bind(
+            function_call={
+                "name": "create_quiz",
+            },
+            functions=[
+                QUIZ_FUNCTION,
+            ],
+        )
+    )
+
+
+def split_path(path):
+    splitter = CharacterTextSplitter.from_tiktoken_encoder(**SPLITTER)
+    loader = UnstructuredFileLoader(path)
+    return loader.load_and_split(text_splitter=splitter)
+
+
+def stream_questions(chain, docs, count):
+    """Each question of one call, as soon as its JSON object closes in the
+    streamed function call arguments."""
+    parser = ObjectStreamParser(depth=2)
+    for chunk in chain.stream({"docs": docs, "count": count}):
+        arguments = chunk.additional_kwargs.get("function_call", {}).get("arguments")
+        if arguments:
+            yield from parser.feed(arguments)
+
+
+def make_quiz(chain, docs, count):
+    """generate_quiz over the page's groups with the questions chain."""
+
+    def make_questions(group, group_count):
+        return stream_questions(chain, group, group_count)
+
+    groups = group_chunks(docs, QUIZ_GROUP_TOKENS)
+    return generate_quiz(groups, make_questions, count, workers=QUIZ_WORKERS)
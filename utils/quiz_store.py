@@ -0,0 +1,151 @@
+# Finished quizzes on disk, keyed by what they were made from.
+#
+# Quizzes survive restarts, and an edited file gets a new quiz even under the
+# same name: each one is stored under a hash of the content (file bytes or
+# Wikipedia text) plus everything else that shapes the questions: prompt,
+# function, model, splitter, group size, question count and QUIZ_VERSION.
+# Change any of them and the old quizzes simply stop matching.
+#
+# Quizzes for a directory of files can be written ahead of time, so the page
+# only has to look them up:
+#   python -m utils.quiz_store --dir ./files --count 10
+
+import argparse
+import json
+import os
+import threading
+import time
+
+from langchain.chat_models import ChatOpenAI
+
+from utils.faiss_store import corpus_key
+from utils.quiz import (
+    QUESTIONS_PROMPT,
+    QUIZ_FUNCTION,
+    QUIZ_GROUP_TOKENS,
+    QUIZ_MODEL,
+    SPLITTER,
+    build_questions_chain,
+    build_questions_prompt,
+    make_quiz,
+    split_path,
+)
+from utils.sqlite_store import connect, open_shared
+
+DEFAULT_QUIZ_STORE_PATH = "./.cache/quizzes.db"
+# bump when the questions should be written again for another reason
+QUIZ_VERSION = 1
+FILE_TYPES = (".pdf", ".txt", ".docx")
+
+
+def quiz_key(content, count):
+    return corpus_key(
+        content,
+        QUIZ_VERSION,
+        QUESTIONS_PROMPT,
+        QUIZ_FUNCTION,
+        QUIZ_MODEL,
+        SPLITTER,
+        QUIZ_GROUP_TOKENS,
+        count,
+    )
+
+
+def open_quiz_store(path=DEFAULT_QUIZ_STORE_PATH):
+    return open_shared(QuizStore, path)
+
+
+class QuizStore:
+    def __init__(self, path):
+        self.path = path
+        self.stats = {"lookups": 0, "hits": 0}
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quizzes (
+                    key TEXT PRIMARY KEY,
+                    questions TEXT NOT NULL,
+                    source TEXT,
+                    created REAL NOT NULL
+                )
+                """
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM quizzes WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, key):
+        with self._lock:
+            self.stats["lookups"] += 1
+            row = self._conn.execute(
+                "SELECT questions FROM quizzes WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key, questions, source=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quizzes (key, questions, source, created)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(questions), source, time.time()),
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM quizzes WHERE key = ?", (key,))
+
+
+def file_key(path, count):
+    with open(path, "rb") as f:
+        return quiz_key(f.read(), count)
+
+
+def pregenerate(paths, store, chain, count, force=False):
+    """Write the quiz of every file that doesn't have one yet."""
+    made = 0
+    for path in paths:
+        key = file_key(path, count)
+        if key in store and not force:
+            print(f"  cached   {path}")
+            continue
+        start = time.perf_counter()
+        quiz = list(make_quiz(chain, split_path(path), count))
+        store.put(key, quiz, source=os.path.basename(path))
+        made += 1
+        print(f"  made     {path}: {len(quiz)} questions in {time.perf_counter() - start:.1f} s")
+    return made
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write QuizGPT quizzes ahead of time.")
+    parser.add_argument("--dir", default="./files")
+    parser.add_argument("--store", default=DEFAULT_QUIZ_STORE_PATH)
+    parser.add_argument("--count", type=int, default=10, help="questions per quiz")
+    parser.add_argument("--force", action="store_true", help="write them again")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.dir, name)
+        for name in os.listdir(args.dir)
+        if name.lower().endswith(FILE_TYPES)
+    )
+    chain = build_questions_chain(ChatOpenAI(**QUIZ_MODEL), build_questions_prompt())
+    made = pregenerate(paths, open_quiz_store(args.store), chain, args.count, args.force)
+    print(f"Made {made} of {len(paths)} quizzes into {args.store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Model clients and chains shared by every session in the server process.
+#
+# Streamlit runs the whole page script again on every widget change, so the
+# ChatOpenAI / ChatOllama clients, prompts and LCEL chains a page uses are
+# built here once per process, keyed by their configuration, instead of on
+# every rerun or question:
+#
+#   llm = get_model(ChatOpenAI, temperature=0.1, streaming=True)
+#   chain = get_chain("document_qa", build_chain, llm=llm)
+#
+# Nothing per session may live in them. Callbacks (the streaming message box)
+# go in at invoke time, chain.invoke(inputs, {"callbacks": [...]}), and so do
+# the chat history and the retriever for the user's file. Since they outlive
+# Streamlit's reload-on-save, restart the server after editing a chain.
+
+import json
+import threading
+
+import openai
+import requests
+
+_resources = {}
+_resources_lock = threading.RLock()
+_session = None
+
+
+def _identity(value):
+    # models and prompts passed to a chain builder come from this registry
+    # too, so the same object means the same chain
+    return f"{type(value).__name__}@{id(value)}"
+
+
+def config_key(kind, config):
+    return kind, json.dumps(config, sort_keys=True, default=_identity)
+
+
+def get_resource(kind, factory, **config):
+    """factory(**config), built the first time this kind + config is asked for."""
+    key = config_key(kind, config)
+    with _resources_lock:
+        if key not in _resources:
+            _resources[key] = factory(**config)
+        return _resources[key]
+
+
+def get_model(model_class, **config):
+    if model_class.__module__.startswith("langchain.chat_models.openai"):
+        use_pooled_session()
+    return get_resource(model_class.__name__, model_class, **config)
+
+
+def get_chain(name, build, **config):
+    return get_resource(f"chain:{name}", build, **config)
+
+
+def use_pooled_session(pool_size=32):
+    """Send every OpenAI call through one keep-alive connection pool.
+
+    The openai client keeps a requests session per thread, and Streamlit runs
+    each rerun on a new thread, so otherwise every answer opened a new TLS
+    connection.
+    """
+    global _session
+    with _resources_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=pool_size, max_retries=2
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            openai.requestssession = _session
+        return _session
+
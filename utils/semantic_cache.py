@@ -0,0 +1,198 @@
+# Answers to earlier questions, found again by meaning instead of by text.
+#
+# LangChain's SQLite LLM cache (cache.db) only hits when the prompt is byte for
+# byte the same, but people ask "what is the farm called?" and "what's the
+# name of the farm?" about the same file all the time. This cache embeds the
+# question and looks for an earlier one close enough to it (cosine similarity
+# >= threshold) among the answers for the same scope: the corpus hash plus the
+# prompt template and model, so a different file or prompt never reuses an
+# answer.
+#
+# Everything lives in one local SQLite file. Entries expire after ttl seconds
+# and the least recently used ones go when there are more than max_entries.
+# The vectors of a scope are kept in memory as one matrix and reloaded when
+# any connection (another process too) has written to the file.
+
+import threading
+import time
+
+import numpy as np
+
+from utils.embedding_cache import model_namespace
+from utils.faiss_store import corpus_key
+from utils.sqlite_store import connect, open_shared
+
+
+def answer_scope(corpus, template, llm=None):
+    """What an answer depends on besides the question."""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    return corpus_key(corpus, template, str(model))
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def open_answer_cache(path, embeddings, **kwargs):
+    return open_shared(SemanticAnswerCache, path, embeddings, **kwargs)
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        path,
+        embeddings,
+        threshold=0.95,
+        ttl=7 * 24 * 60 * 60,
+        max_entries=10000,
+    ):
+        self.path = path
+        self.embeddings = embeddings
+        self.namespace = model_namespace(embeddings)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._matrices = {}
+        self._data_version = None
+        self._conn = connect(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope, namespace)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)"
+            )
+
+    @property
+    def hit_rate(self):
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, scope, question):
+        """Returns (answer, vector). answer is None on a miss; pass the vector
+        back to put() so the question isn't embedded twice."""
+        now = time.time()
+        normalized = normalize_question(question)
+        with self._lock:
+            self.stats["lookups"] += 1
+            row = self._conn.execute(
+                "SELECT id, answer FROM answers WHERE scope = ? AND namespace = ?"
+                " AND question = ? AND created >= ? ORDER BY id DESC LIMIT 1",
+                (scope, self.namespace, normalized, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                self.stats["hits"] += 1
+                self.stats["exact_hits"] += 1
+                self._touch(row[0], now)
+                return row[1], None
+
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._lock:
+            ids, matrix = self._scope_matrix(scope, now)
+            if len(ids):
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self._conn.execute(
+                        "SELECT answer FROM answers WHERE id = ?", (ids[best],)
+                    ).fetchone()
+                    if row is not None:
+                        self.stats["hits"] += 1
+                        self._touch(ids[best], now)
+                        return row[0], vector
+            self.stats["misses"] += 1
+        return None, vector
+
+    def put(self, scope, question, answer, vector=None):
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO answers (scope, namespace, question, vector, answer, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope,
+                    self.namespace,
+                    normalize_question(question),
+                    np.asarray(vector, dtype=np.float32).tobytes(),
+                    answer,
+                    now,
+                    now,
+                ),
+            )
+            self._evict(now)
+            self._matrices.pop(scope, None)
+
+    def clear(self, scope=None):
+        with self._lock, self._conn:
+            if scope is None:
+                self._conn.execute("DELETE FROM answers")
+            else:
+                self._conn.execute("DELETE FROM answers WHERE scope = ?", (scope,))
+            self._matrices.clear()
+
+    def _touch(self, answer_id, now):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE answers SET accessed = ?, hits = hits + 1 WHERE id = ?",
+                (now, answer_id),
+            )
+
+    def _scope_matrix(self, scope, now):
+        # data_version changes when another connection commits, our own
+        # writes drop the scope from _matrices in put()
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._matrices.clear()
+            self._data_version = version
+        cached = self._matrices.get(scope)
+        if cached is None or cached[2] < now - self.ttl:
+            rows = self._conn.execute(
+                "SELECT id, vector, created FROM answers WHERE scope = ? AND namespace = ?"
+                " AND created >= ?",
+                (scope, self.namespace, now - self.ttl),
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            if rows:
+                matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            # reload once the oldest entry expires
+            oldest = min((row[2] for row in rows), default=now)
+            cached = self._matrices[scope] = (ids, matrix, oldest)
+        return cached[0], cached[1]
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            # least recently used first
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN"
+                " (SELECT id FROM answers ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
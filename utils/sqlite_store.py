@@ -0,0 +1,170 @@
+# Packed byte store for the embedding cache.
+#
+# LocalFileStore writes one small file per chunk, so a big corpus turns into
+# tens of thousands of inodes and every lookup is a stat + open + read. This
+# keeps all values in one SQLite file instead: bulk get/put are single
+# statements, old entries can be evicted when the cache grows past max_bytes,
+# and compact() gives the freed pages back to the filesystem. The size is kept
+# as a running total rather than summed on every write; writes from another
+# process only show up in it after total_bytes().
+#
+# open_shared and connect are also what the other SQLite files (answer cache,
+# quiz store, Wikipedia store) open theirs with.
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from langchain.schema import BaseStore
+
+# SQLite's default limit on "?" placeholders is 999 on older builds
+BATCH_SIZE = 500
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def open_shared(cls, path, *args, **kwargs):
+    """One cls(path, ...) per path per process, shared by every session.
+    The arguments only matter the first time."""
+    with _shared_lock:
+        if (cls, path) not in _shared:
+            _shared[cls, path] = cls(path, *args, **kwargs)
+        return _shared[cls, path]
+
+
+def connect(path):
+    """A connection any thread can use (callers hold their own lock), in WAL
+    mode so readers in other processes don't wait for writers."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    with conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def open_store(path, max_bytes=None):
+    return open_shared(SQLiteByteStore, path, max_bytes=max_bytes)
+
+
+class SQLiteByteStore(BaseStore[str, bytes]):
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS kv_accessed ON kv (accessed)")
+            self._total = self._sum()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found = {}
+        now = time.time()
+        with self._lock, self._conn:
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = list(keys[i : i + BATCH_SIZE])
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({marks})", batch
+                ).fetchall()
+                found.update(rows)
+                if rows and self.max_bytes:
+                    # only worth the write when eviction is on
+                    hit = [key for key, _ in rows]
+                    self._conn.execute(
+                        f"UPDATE kv SET accessed = ? WHERE key IN ({','.join('?' * len(hit))})",
+                        [now, *hit],
+                    )
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        # the last value wins, like INSERT OR REPLACE
+        pairs = dict(key_value_pairs)
+        with self._lock, self._conn:
+            replaced = self._size_of(list(pairs))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                [(key, value, len(value), now) for key, value in pairs.items()],
+            )
+            self._total += sum(len(value) for value in pairs.values()) - replaced
+            if self.max_bytes:
+                self._evict()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        keys = list(dict.fromkeys(keys))
+        with self._lock, self._conn:
+            self._total -= self._size_of(keys)
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = keys[i : i + BATCH_SIZE]
+                marks = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM kv WHERE key IN ({marks})", batch)
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            if prefix is None:
+                rows = self._conn.execute("SELECT key FROM kv").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE substr(key, 1, ?) = ?",
+                    (len(prefix), prefix),
+                ).fetchall()
+        for (key,) in rows:
+            yield key
+
+    def total_bytes(self):
+        with self._lock:
+            self._total = self._sum()
+            return self._total
+
+    def _sum(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM kv").fetchone()[0]
+
+    def _size_of(self, keys):
+        # keys must be unique
+        size = 0
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = keys[i : i + BATCH_SIZE]
+            marks = ",".join("?" * len(batch))
+            size += self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM kv WHERE key IN ({marks})", batch
+            ).fetchone()[0]
+        return size
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        # least recently used first, until we're back under the limit
+        excess = self._total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM kv ORDER BY accessed"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM kv WHERE key = ?", doomed)
+        self._total -= freed
+
+    def compact(self):
+        """Rewrite the file without the space left behind by deleted entries."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
@@ -0,0 +1,257 @@
+# Wikipedia articles on disk for QuizGPT.
+#
+# Articles live in one SQLite file, so a topic is fetched from the live API
+# once and QuizGPT works offline: every live fetch is saved (with the term
+# that found it), and a dump subset can be imported ahead of time, one JSON
+# article per line as wikiextractor --json writes them ({"title", "text",
+# "url"}):
+#
+#   python -m utils.wiki_store --import articles.jsonl
+#   python -m utils.wiki_store --lookup "world war"
+#
+# A term is looked up as: a term searched before, an exact title, then a
+# full-text search over the titles (every word of the term has to be in the
+# title, best bm25 first). Only when all of that misses does WikipediaSource
+# go to the API, and never with offline=True.
+
+import argparse
+import json
+import re
+import threading
+import time
+
+from langchain.retrievers import WikipediaRetriever
+from langchain.schema import Document
+
+from utils.sqlite_store import connect, open_shared
+
+DEFAULT_WIKI_STORE_PATH = "./.cache/wikipedia.db"
+# what WikipediaRetriever keeps of an article
+DOC_CONTENT_CHARS_MAX = 4000
+
+
+def normalize_title(text):
+    return " ".join(text.replace("_", " ").lower().split())
+
+
+def title_query(term):
+    """FTS5 query matching titles with every word of term, the last one as
+    a prefix ("world wa" finds "World War II")."""
+    words = re.findall(r"\w+", term.lower())
+    if not words:
+        return None
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def open_wiki_store(path=DEFAULT_WIKI_STORE_PATH):
+    return open_shared(WikiArticleStore, path)
+
+
+class WikiArticleStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS articles (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE NOT NULL,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    summary TEXT,
+                    source TEXT,
+                    fetched REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS titles USING fts5(title)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS searches (
+                    term TEXT PRIMARY KEY,
+                    article INTEGER NOT NULL
+                )
+                """
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def put(self, doc, term=None):
+        """Save an article (a WikipediaRetriever document), remembering the
+        term it was found with."""
+        with self._lock, self._conn:
+            article = self._put(
+                doc.metadata["title"],
+                doc.page_content,
+                doc.metadata.get("summary"),
+                doc.metadata.get("source"),
+            )
+            if term:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO searches (term, article) VALUES (?, ?)",
+                    (normalize_title(term), article),
+                )
+
+    def import_articles(self, articles, batch_size=1000):
+        """Bulk load (title, text, url) tuples. Returns how many."""
+        count = 0
+        batch = []
+        for article in articles:
+            batch.append(article)
+            if len(batch) >= batch_size:
+                count += self._import(batch)
+                batch = []
+        if batch:
+            count += self._import(batch)
+        return count
+
+    def _import(self, batch):
+        with self._lock, self._conn:
+            for title, text, url in batch:
+                self._put(title, text, None, url)
+        return len(batch)
+
+    def _put(self, title, content, summary, source):
+        key = normalize_title(title)
+        row = self._conn.execute("SELECT id FROM articles WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute(
+                "UPDATE articles SET title = ?, content = ?, summary = ?, source = ?,"
+                " fetched = ? WHERE id = ?",
+                (title, content, summary, source, time.time(), row[0]),
+            )
+            self._conn.execute("UPDATE titles SET title = ? WHERE rowid = ?", (title, row[0]))
+            return row[0]
+        article = self._conn.execute(
+            "INSERT INTO articles (key, title, content, summary, source, fetched)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, title, content, summary, source, time.time()),
+        ).lastrowid
+        self._conn.execute("INSERT INTO titles (rowid, title) VALUES (?, ?)", (article, title))
+        return article
+
+    def find(self, term, limit=1):
+        """Articles for a search term, best first; [] when none match."""
+        key = normalize_title(term)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT article FROM searches WHERE term = ?", (key,)
+            ).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT id FROM articles WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                ids = [row[0]]
+            else:
+                query = title_query(term)
+                if query is None:
+                    return []
+                ids = [
+                    row[0]
+                    for row in self._conn.execute(
+                        "SELECT rowid FROM titles WHERE titles MATCH ?"
+                        " ORDER BY bm25(titles) LIMIT ?",
+                        (query, limit),
+                    )
+                ]
+            docs = []
+            for article in ids[:limit]:
+                row = self._conn.execute(
+                    "SELECT title, content, summary, source FROM articles WHERE id = ?",
+                    (article,),
+                ).fetchone()
+                if row is not None:
+                    docs.append(
+                        Document(
+                            page_content=row[1],
+                            metadata={"title": row[0], "summary": row[2], "source": row[3]},
+                        )
+                    )
+        return docs
+
+
+class WikipediaSource:
+    """Articles for a term from the store, from the live API only when the
+    store has none (and saved for next time).
+
+    fetch(term) returns documents like WikipediaRetriever's; by default it
+    is a WikipediaRetriever, created on the first miss.
+    """
+
+    def __init__(self, store, fetch=None, offline=False, top_k_results=1):
+        self.store = store
+        self.fetch = fetch
+        self.offline = offline
+        self.top_k_results = top_k_results
+        self.stats = {"lookups": 0, "hits": 0, "fetches": 0}
+
+    def get_relevant_documents(self, term):
+        self.stats["lookups"] += 1
+        docs = self.store.find(term, self.top_k_results)
+        if docs:
+            self.stats["hits"] += 1
+        elif not self.offline:
+            self.stats["fetches"] += 1
+            docs = self._fetch(term)
+            for i, doc in enumerate(docs):
+                # the term leads to the best match only
+                self.store.put(doc, term if i == 0 else None)
+        return [
+            Document(page_content=doc.page_content[:DOC_CONTENT_CHARS_MAX], metadata=doc.metadata)
+            for doc in docs
+        ]
+
+    def _fetch(self, term):
+        if self.fetch is None:
+            retriever = WikipediaRetriever(
+                top_k_results=self.top_k_results,
+                doc_content_chars_max=1_000_000,
+            )
+            self.fetch = retriever.get_relevant_documents
+        return self.fetch(term)
+
+
+def read_dump(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                article = json.loads(line)
+                if article.get("text"):
+                    yield article["title"], article["text"], article.get("url")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Wikipedia articles for QuizGPT.")
+    parser.add_argument("--store", default=DEFAULT_WIKI_STORE_PATH)
+    parser.add_argument("--import", dest="dump", help="JSON lines of {title, text, url}")
+    parser.add_argument("--lookup", help="show what a search term finds")
+    args = parser.parse_args()
+
+    store = open_wiki_store(args.store)
+    if args.dump:
+        start = time.perf_counter()
+        count = store.import_articles(read_dump(args.dump))
+        print(f"Imported {count} articles in {time.perf_counter() - start:.1f} s, {len(store)} in {args.store}")
+    if args.lookup:
+        start = time.perf_counter()
+        docs = store.find(args.lookup, limit=5)
+        print(f"{len(docs)} articles in {(time.perf_counter() - start) * 1000:.2f} ms")
+        for doc in docs:
+            print(f"  {doc.metadata['title']}: {doc.page_content[:80]!r}")
+
+
+if __name__ == "__main__":
+    main()